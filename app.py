@@ -1,16 +1,70 @@
+# Cap native thread pools before anything imports NumPy (see thread_limits)
+from thread_limits import limit_native_threads
+limit_native_threads()
+
 from flask import Flask, render_template, request, jsonify
+from flask.json.provider import JSONProvider
+import cv2
+import gc
+import numpy as np
+import orjson
+import hashlib
+import hmac
 import os
+import threading
+import time
 import traceback
-from image_processor import analyze_image, analyze_image_multi
-from emotion_backends import get_available_backends
+import uuid
+from image_processor import analyze_array, analyze_array_multi, analyze_images_multi, eager_init_backends
+from emotion_backends import get_available_backends, preprocess, refresh_backends
 from baseline_manager import baseline_manager
 
+class OrjsonProvider(JSONProvider):
+    """Serialize responses with orjson, which also handles NumPy values natively"""
+    
+    options = orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+    
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, option=self.options).decode()
+    
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+    
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(orjson.dumps(obj, option=self.options),
+                                        mimetype='application/json')
+
 app = Flask(__name__)
+app.json = OrjsonProvider(app)
+
+# Single-image uploads are decoded in memory; only /upload_batch still
+# stages files, which are deleted right after analysis - keep them on tmpfs
+# where available so they never touch disk
+UPLOAD_FOLDER = '/dev/shm/emotion_uploads' if os.path.isdir('/dev/shm') else 'uploads'
+UPLOAD_CHUNK_SIZE = 1 << 20
 
-UPLOAD_FOLDER = 'uploads'
+# Leading bytes of the accepted image formats (PNG, JPEG, GIF)
+IMAGE_SIGNATURES = (b'\x89PNG\r\n\x1a\n', b'\xff\xd8\xff', b'GIF87a', b'GIF89a')
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 os.makedirs(UPLOAD_FOLDER, exist_ok=True)
 
+# Decoded images, TF intermediates and face crops can sit in reference cycles;
+# collect periodically so long-running workers keep a bounded RSS without
+# paying for a full collection on every request
+GC_EVERY_N_REQUESTS = 50
+_request_count = 0
+_request_count_lock = threading.Lock()
+
+@app.teardown_request
+def collect_garbage(exc=None):
+    global _request_count
+    with _request_count_lock:
+        _request_count += 1
+        run_gc = _request_count % GC_EVERY_N_REQUESTS == 0
+    if run_gc:
+        gc.collect()
+
 @app.route('/')
 def index():
     # Pass available backends to the template
@@ -25,60 +79,184 @@ def upload_file():
         file = request.files['file']
         if file.filename == '':
             return jsonify({'error': 'No selected file'}), 400
-        if file and file.filename.lower().endswith(('.png', '.jpg', '.jpeg', '.gif')):
-            filename = os.path.join(app.config['UPLOAD_FOLDER'], file.filename)
-            file.save(filename)
+        if file and is_supported_image(file):
+            # Decode straight from the upload buffer - no disk round-trip
+            img = decode_upload(file)
+            if img is None:
+                return jsonify({'error': 'Could not decode image'}), 400
+            
+            result = analyze_upload(img, request.form, wants_comparison(request.args))
+            
+            return jsonify(result)
+        else:
+            return jsonify({'error': 'Invalid file type'}), 400
+    except Exception as e:
+        app.logger.error(f"An error occurred: {str(e)}")
+        app.logger.error(traceback.format_exc())
+        return jsonify({'error': 'An internal server error occurred'}), 500
+
+@app.route('/upload_batch', methods=['POST'])
+def upload_batch():
+    """Analyze several uploaded images in one request"""
+    try:
+        files = [f for f in request.files.getlist('files') if f.filename != '']
+        if not files:
+            return jsonify({'error': 'No selected files'}), 400
+        if not all(is_supported_image(f) for f in files):
+            return jsonify({'error': 'Invalid file type'}), 400
+        
+        # Files are staged under their content hash, so identical images in a
+        # batch are written and analyzed once
+        filenames = []
+        file_indices = []
+        digests = {}
+        try:
+            for file in files:
+                filename = save_upload(file)
+                digest = os.path.basename(filename)
+                if digest in digests:
+                    file_indices.append(digests[digest])
+                    continue
+                digests[digest] = len(filenames)
+                file_indices.append(len(filenames))
+                filenames.append(filename)
             
-            # Get selected backends from form data
             backends = request.form.getlist('backends')
             if not backends:
-                # Default to all available backends if none specified
                 backends = get_available_backends()
             
-            # Determine analysis mode
-            analysis_mode = request.form.get('analysis_mode', 'multi')
+            unique_results = analyze_images_multi(filenames, backends, wants_comparison(request.args))
             
-            try:
-                if analysis_mode == 'single' or len(backends) == 1:
-                    # Use single-backend analysis for backward compatibility
-                    result = analyze_image(filename)
-                    result['analysis_mode'] = 'single'
-                    result['backend_used'] = backends[0] if backends else 'fer'
-                else:
-                    # Use multi-backend analysis
-                    result = analyze_image_multi(filename, backends)
-                    result['analysis_mode'] = 'multi'
-                    
-                    # Multi-backend analysis completed
-                
-                # Check if user wants baseline analysis
-                use_baseline = request.form.get('use_baseline', 'false').lower() == 'true'
-                
+            use_baseline = request.form.get('use_baseline', 'false').lower() == 'true'
+            person_id = request.form.get('person_id')
+            results = []
+            for file, index in zip(files, file_indices):
+                result = dict(unique_results[index])
+                result['analysis_mode'] = 'multi'
+                result['filename'] = file.filename
                 if use_baseline:
-                    # Add baseline delta analysis for FACS results
-                    # Create a list of items to avoid modifying dict during iteration
-                    delta_results = {}
-                    for backend_name, backend_result in list(result.items()):
-                        if (isinstance(backend_result, dict) and 
-                            backend_result.get('analysis_type') == 'pure_facs'):
-                            delta_result = baseline_manager.calculate_delta(backend_result)
-                            delta_results[f'{backend_name}_delta'] = delta_result
-                    
-                    # Add delta results after iteration
-                    result.update(delta_results)
-                
-                return jsonify(result)
-            finally:
-                # Always clean up uploaded file
+                    add_baseline_deltas(result, person_id)
+                results.append(result)
+            
+            return jsonify({'results': results, 'total_images': len(results)})
+        finally:
+            # Always clean up uploaded files
+            for filename in filenames:
                 if os.path.exists(filename):
                     os.remove(filename)
-        else:
-            return jsonify({'error': 'Invalid file type'}), 400
     except Exception as e:
         app.logger.error(f"An error occurred: {str(e)}")
         app.logger.error(traceback.format_exc())
         return jsonify({'error': 'An internal server error occurred'}), 500
 
+def is_supported_image(file):
+    """
+    Check an upload's magic bytes against the accepted image formats
+    
+    The client-supplied extension is not trusted; only the first bytes are
+    peeked, so bad uploads are rejected before anything is read or decoded.
+    """
+    header = file.stream.read(16)
+    file.stream.seek(0)
+    return header.startswith(IMAGE_SIGNATURES)
+
+def wants_comparison(args):
+    """Whether the cross-backend comparison was requested (?comparison=false skips it)"""
+    return args.get('comparison', 'true').lower() == 'true'
+
+def analyze_upload(img, form, compute_comparison=True):
+    """Run the analysis selected by an /upload form on a decoded image"""
+    # Get selected backends from form data
+    backends = form.getlist('backends')
+    if not backends:
+        # Default to all available backends if none specified
+        backends = get_available_backends()
+    
+    # Determine analysis mode
+    analysis_mode = form.get('analysis_mode', 'multi')
+    
+    if analysis_mode == 'single' or len(backends) == 1:
+        # Use single-backend analysis for backward compatibility
+        result = analyze_array(img)
+        result['analysis_mode'] = 'single'
+        result['backend_used'] = backends[0] if backends else 'fer'
+    else:
+        # Use multi-backend analysis
+        result = analyze_array_multi(img, backends, compute_comparison)
+        result['analysis_mode'] = 'multi'
+        
+        # Multi-backend analysis completed
+    
+    # Check if user wants baseline analysis
+    use_baseline = form.get('use_baseline', 'false').lower() == 'true'
+    
+    if use_baseline:
+        add_baseline_deltas(result, form.get('person_id'))
+    
+    return result
+
+def save_upload(file):
+    """
+    Copy an upload into UPLOAD_FOLDER, named by a hash of its content
+    
+    The copy uses large chunks (file.save uses 16KB writes) and hashes them
+    on the way through. Names are scoped to the calling thread so concurrent
+    requests never share or delete each other's files.
+    
+    Returns:
+        str: Path of the staged file
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    temp_name = os.path.join(app.config['UPLOAD_FOLDER'], f"upload_{uuid.uuid4().hex}.part")
+    try:
+        with open(temp_name, 'wb', buffering=UPLOAD_CHUNK_SIZE) as f:
+            while True:
+                chunk = file.stream.read(UPLOAD_CHUNK_SIZE)
+                if not chunk:
+                    break
+                digest.update(chunk)
+                f.write(chunk)
+        filename = os.path.join(app.config['UPLOAD_FOLDER'],
+                                f"{os.getpid()}_{threading.get_ident()}_{digest.hexdigest()}")
+        os.replace(temp_name, filename)
+    finally:
+        if os.path.exists(temp_name):
+            os.remove(temp_name)
+    return filename
+
+def decode_upload(file):
+    """
+    Decode an uploaded image into a BGR ndarray, or None if it isn't one
+    
+    Oversized images are downscaled (see emotion_backends.preprocess), so
+    face boxes in the results are in the coordinates of the analyzed image.
+    """
+    return decode_image(file.stream.read())
+
+def decode_image(data):
+    """Decode image bytes into a (possibly downscaled) BGR ndarray, or None"""
+    buf = np.frombuffer(data, np.uint8)
+    if buf.size == 0:
+        return None
+    img = cv2.imdecode(buf, cv2.IMREAD_COLOR)
+    if img is None:
+        return None
+    img, _ = preprocess(img)
+    return img
+
+def add_baseline_deltas(result, person_id=None):
+    """Add baseline delta analysis for FACS results (default: current baseline)"""
+    # Create a list of items to avoid modifying dict during iteration
+    delta_results = {}
+    for backend_name, backend_result in list(result.items()):
+        if (isinstance(backend_result, dict) and 
+            backend_result.get('analysis_type') == 'pure_facs'):
+            delta_result = baseline_manager.calculate_delta(backend_result, person_id)
+            delta_results[f'{backend_name}_delta'] = delta_result
+    
+    # Add delta results after iteration
+    result.update(delta_results)
+
 @app.route('/api/backends', methods=['GET'])
 def get_backends():
     """API endpoint to get available backends"""
@@ -92,6 +270,36 @@ def get_backends():
         app.logger.error(f"Error getting backends: {str(e)}")
         return jsonify({'error': 'Could not get available backends'}), 500
 
+# Re-probing imports (and may load) every backend's models, so it is an admin
+# operation: disabled unless a token is configured, and rate limited
+ADMIN_TOKEN = os.environ.get('ADMIN_TOKEN')
+REFRESH_MIN_INTERVAL = 60.0
+_last_refresh = 0.0
+_refresh_lock = threading.Lock()
+
+@app.route('/api/backends/refresh', methods=['POST'])
+def refresh_available_backends():
+    """Re-probe backend availability, e.g. after installing a backend"""
+    global _last_refresh
+    if not ADMIN_TOKEN:
+        return jsonify({'error': 'Backend refresh is disabled (ADMIN_TOKEN not set)'}), 403
+    token = request.headers.get('X-Admin-Token', '')
+    if not hmac.compare_digest(token.encode(), ADMIN_TOKEN.encode()):
+        return jsonify({'error': 'Invalid admin token'}), 403
+    
+    with _refresh_lock:
+        now = time.monotonic()
+        if _last_refresh and now - _last_refresh < REFRESH_MIN_INTERVAL:
+            return jsonify({'error': 'Backends were refreshed recently, try again later'}), 429
+        _last_refresh = now
+    
+    try:
+        available = refresh_backends()
+        return jsonify({'available_backends': available})
+    except Exception as e:
+        app.logger.error(f"Error refreshing backends: {str(e)}")
+        return jsonify({'error': 'Could not refresh available backends'}), 500
+
 @app.route('/set_baseline', methods=['POST'])
 def set_baseline():
     """Set baseline from uploaded image"""
@@ -103,37 +311,33 @@ def set_baseline():
         if file.filename == '':
             return jsonify({'error': 'No selected file'}), 400
         
-        if file and file.filename.lower().endswith(('.png', '.jpg', '.jpeg', '.gif')):
-            filename = os.path.join(app.config['UPLOAD_FOLDER'], f"baseline_{file.filename}")
-            file.save(filename)
+        if file and is_supported_image(file):
+            img = decode_upload(file)
+            if img is None:
+                return jsonify({'error': 'Could not decode image'}), 400
             
-            try:
-                # Get person ID
-                person_id = request.form.get('person_id', 'default')
-                
-                # Analyze with FACS only
-                result = analyze_image_multi(filename, ['simplefacs'])
-                
-                # Check if FACS analysis was successful
-                facs_result = result.get('simplefacs')
-                if facs_result and facs_result.get('analysis_type') == 'pure_facs':
-                    success = baseline_manager.set_baseline(facs_result, person_id)
-                    if success:
-                        baseline_info = baseline_manager.get_baseline_info()
-                        return jsonify({
-                            'success': True,
-                            'message': f'Baseline set for {person_id}',
-                            'baseline_info': baseline_info,
-                            'facs_result': facs_result
-                        })
-                    else:
-                        return jsonify({'error': 'Failed to set baseline'}), 500
+            # Get person ID
+            person_id = request.form.get('person_id', 'default')
+            
+            # Analyze with FACS only
+            result = analyze_array_multi(img, ['simplefacs'])
+            
+            # Check if FACS analysis was successful
+            facs_result = result.get('simplefacs')
+            if facs_result and facs_result.get('analysis_type') == 'pure_facs':
+                success = baseline_manager.set_baseline(facs_result, person_id)
+                if success:
+                    baseline_info = baseline_manager.get_baseline_info(person_id)
+                    return jsonify({
+                        'success': True,
+                        'message': f'Baseline set for {person_id}',
+                        'baseline_info': baseline_info,
+                        'facs_result': facs_result
+                    })
                 else:
-                    return jsonify({'error': 'FACS analysis failed for baseline'}), 500
-            finally:
-                # Clean up baseline file
-                if os.path.exists(filename):
-                    os.remove(filename)
+                    return jsonify({'error': 'Failed to set baseline'}), 500
+            else:
+                return jsonify({'error': 'FACS analysis failed for baseline'}), 500
         else:
             return jsonify({'error': 'Invalid file type'}), 400
     except Exception as e:
@@ -143,7 +347,7 @@ def set_baseline():
 @app.route('/baseline_info', methods=['GET'])
 def get_baseline_info():
     """Get current baseline information"""
-    baseline_info = baseline_manager.get_baseline_info()
+    baseline_info = baseline_manager.get_baseline_info(request.args.get('person_id'))
     return jsonify({
         'has_baseline': baseline_info is not None,
         'baseline_info': baseline_info
@@ -165,4 +369,6 @@ def clear_baseline():
         return jsonify({'error': f'Clear baseline failed: {str(e)}'}), 500
 
 if __name__ == '__main__':
-    app.run(debug=True)
\ No newline at end of file
+    # Development server only - use gunicorn (see gunicorn.conf.py) in production
+    eager_init_backends()
+    app.run(debug=os.environ.get('FLASK_DEBUG') == '1')
\ No newline at end of file
@@ -0,0 +1,80 @@
+"""
+ASGI entry point with async upload handling
+
+Run with: WEB_CONCURRENCY=4 hypercorn asgi:app -w 4 -k asyncio
+(WEB_CONCURRENCY must match -w so native thread pools are sized per worker)
+
+/upload is served by a Quart app: the request body is received on the event
+loop and decoding + inference run in a worker thread, so one worker can keep
+accepting uploads while earlier ones are still being analyzed. Every other
+route is the unchanged Flask app, mounted through WsgiToAsgi. The plain
+WSGI deployment (wsgi.py / gunicorn) remains the default; choosing this
+module is the switch.
+"""
+
+import asyncio
+
+import orjson
+from asgiref.wsgi import WsgiToAsgi
+from quart import Quart, Response, request
+
+from app import OrjsonProvider, analyze_upload, app as flask_app, decode_image, is_supported_image, wants_comparison
+from image_processor import eager_init_backends
+
+# Routes handled asynchronously; everything else falls through to Flask
+ASYNC_PATHS = {'/upload'}
+
+quart_app = Quart(__name__)
+_flask_asgi = WsgiToAsgi(flask_app)
+
+
+@quart_app.before_serving
+async def preload_backends():
+    # Off the event loop, so lifespan startup doesn't block on model loading
+    asyncio.get_running_loop().run_in_executor(None, eager_init_backends)
+
+
+def json_response(payload, status=200):
+    """Serialize a response payload the same way the Flask app does"""
+    return Response(orjson.dumps(payload, option=OrjsonProvider.options),
+                    status=status, mimetype='application/json')
+
+
+def _decode_and_analyze(data, form, compute_comparison):
+    # Decode and analyze in the same thread: decoded images may live in that
+    # thread's scratch buffer (see emotion_backends.preprocess)
+    img = decode_image(data)
+    if img is None:
+        return None
+    return analyze_upload(img, form, compute_comparison)
+
+
+@quart_app.route('/upload', methods=['POST'])
+async def upload_file():
+    try:
+        files = await request.files
+        form = await request.form
+        if 'file' not in files:
+            return json_response({'error': 'No file part'}, 400)
+        file = files['file']
+        if file.filename == '':
+            return json_response({'error': 'No selected file'}, 400)
+        if not is_supported_image(file):
+            return json_response({'error': 'Invalid file type'}, 400)
+        
+        result = await asyncio.to_thread(_decode_and_analyze, file.read(), form,
+                                         wants_comparison(request.args))
+        if result is None:
+            return json_response({'error': 'Could not decode image'}, 400)
+        return json_response(result)
+    except Exception:
+        quart_app.logger.exception("An error occurred")
+        return json_response({'error': 'An internal server error occurred'}, 500)
+
+
+async def app(scope, receive, send):
+    """Dispatch hot paths to Quart and the rest to the Flask app"""
+    if scope['type'] == 'lifespan' or scope.get('path') in ASYNC_PATHS:
+        await quart_app(scope, receive, send)
+    else:
+        await _flask_asgi(scope, receive, send)
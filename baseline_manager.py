@@ -5,13 +5,47 @@ Manages baseline facial measurements for delta analysis.
 Allows comparison of expressions against a neutral baseline to isolate actual movements.
 """
 
-import json
+import atexit
 import os
+import queue
+import threading
 import time
 from datetime import datetime
-from typing import Dict, Optional, Any
+from typing import Dict, Optional, Any, Tuple
 import logging
 
+import numpy as np
+import orjson
+
+# Fixed Action Unit order used for vectorized baseline/current comparison
+AU_ORDER = (
+    'AU01', 'AU02', 'AU04', 'AU05', 'AU06', 'AU07', 'AU09', 'AU10', 'AU11',
+    'AU12', 'AU13', 'AU14', 'AU15', 'AU16', 'AU17', 'AU18', 'AU20', 'AU22',
+    'AU23', 'AU24', 'AU25', 'AU26', 'AU27', 'AU28', 'AU43', 'AU45'
+)
+
+_AU_INDEX = {au: i for i, au in enumerate(AU_ORDER)}
+AU01_IDX = _AU_INDEX['AU01']
+AU02_IDX = _AU_INDEX['AU02']
+AU04_IDX = _AU_INDEX['AU04']
+AU06_IDX = _AU_INDEX['AU06']
+AU12_IDX = _AU_INDEX['AU12']
+AU15_IDX = _AU_INDEX['AU15']
+AU26_IDX = _AU_INDEX['AU26']
+
+# Upper bounds of the minimal/moderate/significant bands in _classify_change
+CHANGE_BOUNDS = np.array([0.1, 0.3, 0.5])
+CHANGE_TYPES = np.array(['minimal', 'moderate', 'significant', 'major'])
+
+# How long interpreter exit waits for queued baseline writes
+EXIT_DRAIN_TIMEOUT = 5.0
+
+
+def _au_vector(action_units: Dict[str, Dict], au_order=AU_ORDER) -> np.ndarray:
+    """Return AU intensities as a vector aligned to au_order (0.0 when absent)"""
+    return np.array([action_units.get(au, {}).get('intensity', 0.0) for au in au_order],
+                    dtype=np.float64)
+
 class BaselineManager:
     """Manages baseline facial measurements for FACS delta analysis"""
     
@@ -23,11 +57,26 @@ class BaselineManager:
             baseline_dir: Directory to store baseline data
         """
         self.baseline_dir = baseline_dir
-        self.current_baseline = None
-        self.baseline_timestamp = None
+        
+        # person_id -> (file mtime, AU vector, baseline data). The mtime is None
+        # while a baseline set in this process is still waiting to be written.
+        self._baselines: Dict[str, Tuple[Optional[float], np.ndarray, Dict[str, Any]]] = {}
+        self._baselines_lock = threading.Lock()
+        
+        # Person used when callers don't name one: the last baseline set or loaded
+        self.current_person: Optional[str] = None
         
         # Create baseline directory if it doesn't exist
         os.makedirs(baseline_dir, exist_ok=True)
+        
+        # Baseline files are written behind the request by a background thread;
+        # the in-memory baseline is what subsequent requests read. The thread
+        # is started on the first write, in the process that does it: this
+        # module is imported in the gunicorn master (preload_app), and threads
+        # don't survive the fork into the workers.
+        self._reset_writer()
+        os.register_at_fork(after_in_child=self._after_fork)
+        atexit.register(self._drain, EXIT_DRAIN_TIMEOUT)
     
     def set_baseline(self, facs_result: Dict[str, Any], person_id: str = "default") -> bool:
         """
@@ -45,24 +94,30 @@ class BaselineManager:
                 logging.error("Invalid FACS result for baseline")
                 return False
             
+            # Round intensities once here so the stored JSON carries short
+            # 3-decimal floats rather than full-precision ones
+            action_units = {
+                au_code: {**au_data, 'intensity': round(float(au_data.get('intensity', 0.0)), 3)}
+                for au_code, au_data in facs_result.get('action_units', {}).items()
+            }
+            
             # Extract baseline data
             baseline_data = {
                 'person_id': person_id,
                 'timestamp': datetime.now().isoformat(),
-                'action_units': facs_result.get('action_units', {}),
+                'action_units': action_units,
                 'total_aus_detected': facs_result.get('total_aus_detected', 0),
                 'analyzer': facs_result.get('analyzer', 'unknown'),
                 'note': f"Baseline set for {person_id}"
             }
             
             # Store in memory
-            self.current_baseline = baseline_data
-            self.baseline_timestamp = baseline_data['timestamp']
+            with self._baselines_lock:
+                self._baselines[person_id] = (None, _au_vector(action_units), baseline_data)
+                self.current_person = person_id
             
-            # Save to file
-            baseline_file = os.path.join(self.baseline_dir, f"{person_id}_baseline.json")
-            with open(baseline_file, 'w') as f:
-                json.dump(baseline_data, f, indent=2)
+            # Queue the file write
+            self._enqueue_write(self._baseline_file(person_id), baseline_data)
             
             logging.info(f"Baseline set for {person_id} with {baseline_data['total_aus_detected']} AUs")
             return True
@@ -82,15 +137,15 @@ class BaselineManager:
             bool: True if baseline was loaded successfully
         """
         try:
-            baseline_file = os.path.join(self.baseline_dir, f"{person_id}_baseline.json")
+            # Make sure queued writes have reached the disk
+            self._drain()
             
-            if not os.path.exists(baseline_file):
+            if self._load_cached(person_id) is None:
                 logging.warning(f"No baseline file found for {person_id}")
                 return False
             
-            with open(baseline_file, 'r') as f:
-                self.current_baseline = json.load(f)
-                self.baseline_timestamp = self.current_baseline['timestamp']
+            with self._baselines_lock:
+                self.current_person = person_id
             
             logging.info(f"Baseline loaded for {person_id}")
             return True
@@ -99,17 +154,20 @@ class BaselineManager:
             logging.error(f"Failed to load baseline: {e}")
             return False
     
-    def calculate_delta(self, facs_result: Dict[str, Any]) -> Dict[str, Any]:
+    def calculate_delta(self, facs_result: Dict[str, Any],
+                        person_id: Optional[str] = None) -> Dict[str, Any]:
         """
         Calculate delta between current FACS result and baseline
         
         Args:
             facs_result: Current FACS analysis result
+            person_id: Whose baseline to compare against (default: current baseline)
             
         Returns:
             Dict containing delta analysis with baseline comparison
         """
-        if not self.current_baseline:
+        entry = self._get_baseline(person_id)
+        if entry is None:
             return {
                 'error': 'No baseline set',
                 'has_baseline': False
@@ -122,50 +180,64 @@ class BaselineManager:
             }
         
         try:
-            baseline_aus = self.current_baseline['action_units']
+            _, cached_vec, baseline_data = entry
+            baseline_aus = baseline_data['action_units']
             current_aus = facs_result.get('action_units', {})
             
-            # Calculate deltas for each Action Unit
-            deltas = {}
-            significant_changes = []
+            # Align baseline and current intensities on a fixed AU order so the
+            # comparison is a single vector subtraction. AUs outside AU_ORDER
+            # (unusual, but py-feat can report them) are appended at the end.
+            extra_aus = sorted((baseline_aus.keys() | current_aus.keys()) - set(AU_ORDER))
+            if extra_aus:
+                au_order = AU_ORDER + tuple(extra_aus)
+                baseline_vec = _au_vector(baseline_aus, au_order)
+            else:
+                au_order = AU_ORDER
+                baseline_vec = cached_vec
+            current_vec = _au_vector(current_aus, au_order)
             
-            # Get all unique AUs from both baseline and current
-            all_aus = set(baseline_aus.keys()) | set(current_aus.keys())
+            delta_vec = current_vec - baseline_vec
+            abs_delta = np.abs(delta_vec)
+            change_types = CHANGE_TYPES[np.searchsorted(CHANGE_BOUNDS, abs_delta, side='right')]
+            rounded_delta_vec = np.round(delta_vec, 3)
+            rounded_delta = rounded_delta_vec.tolist()
+            rounded_baseline = np.round(baseline_vec, 3).tolist()
+            rounded_current = np.round(current_vec, 3).tolist()
             
-            for au_code in all_aus:
-                baseline_intensity = baseline_aus.get(au_code, {}).get('intensity', 0.0)
-                current_intensity = current_aus.get(au_code, {}).get('intensity', 0.0)
-                
-                delta = current_intensity - baseline_intensity
-                
+            # Report every AU present in either the baseline or the current result
+            deltas = {}
+            for i, au_code in enumerate(au_order):
+                if au_code not in baseline_aus and au_code not in current_aus:
+                    continue
                 deltas[au_code] = {
-                    'delta': round(delta, 3),
-                    'baseline': round(baseline_intensity, 3),
-                    'current': round(current_intensity, 3),
+                    'delta': rounded_delta[i],
+                    'baseline': rounded_baseline[i],
+                    'current': rounded_current[i],
                     'description': current_aus.get(au_code, {}).get('description', 
                                                  baseline_aus.get(au_code, {}).get('description', 'Unknown AU')),
-                    'change_type': self._classify_change(delta)
+                    'change_type': str(change_types[i])
                 }
-                
-                # Track significant changes (>0.2 intensity change)
-                if abs(delta) > 0.2:
-                    significant_changes.append({
-                        'au': au_code,
-                        'delta': delta,
-                        'description': deltas[au_code]['description'],
-                        'change_type': deltas[au_code]['change_type']
-                    })
             
-            # Sort significant changes by magnitude
-            significant_changes.sort(key=lambda x: abs(x['delta']), reverse=True)
+            # Track significant changes (>0.2 intensity change), largest first
+            significant_idx = np.flatnonzero(abs_delta > 0.2)
+            significant_idx = significant_idx[np.argsort(-abs_delta[significant_idx], kind='stable')]
+            significant_changes = [
+                {
+                    'au': au_order[i],
+                    'delta': float(delta_vec[i]),
+                    'description': deltas[au_order[i]]['description'],
+                    'change_type': deltas[au_order[i]]['change_type']
+                }
+                for i in significant_idx
+            ]
             
             # Detect movement patterns
-            movement_patterns = self._detect_movement_patterns(deltas)
+            movement_patterns = self._detect_movement_patterns(rounded_delta_vec)
             
             return {
                 'has_baseline': True,
-                'baseline_timestamp': self.baseline_timestamp,
-                'baseline_person': self.current_baseline['person_id'],
+                'baseline_timestamp': baseline_data['timestamp'],
+                'baseline_person': baseline_data['person_id'],
                 'deltas': deltas,
                 'significant_changes': significant_changes,
                 'movement_patterns': movement_patterns,
@@ -191,13 +263,16 @@ class BaselineManager:
             bool: True if cleared successfully
         """
         try:
-            self.current_baseline = None
-            self.baseline_timestamp = None
+            # Remove the file before dropping the cached copy, so a concurrent
+            # read can't reload the cleared baseline from disk. Pending writes
+            # go first, or one could recreate the file afterwards.
+            self._drain()
+            self._write_file(self._baseline_file(person_id), None)
             
-            # Optionally remove file
-            baseline_file = os.path.join(self.baseline_dir, f"{person_id}_baseline.json")
-            if os.path.exists(baseline_file):
-                os.remove(baseline_file)
+            with self._baselines_lock:
+                self._baselines.pop(person_id, None)
+                if self.current_person == person_id:
+                    self.current_person = None
             
             logging.info(f"Baseline cleared for {person_id}")
             return True
@@ -206,25 +281,191 @@ class BaselineManager:
             logging.error(f"Failed to clear baseline: {e}")
             return False
     
-    def get_baseline_info(self) -> Optional[Dict[str, Any]]:
+    def get_baseline_info(self, person_id: Optional[str] = None) -> Optional[Dict[str, Any]]:
         """
-        Get information about current baseline
+        Get information about a baseline
         
+        Args:
+            person_id: Whose baseline to describe (default: current baseline)
+            
         Returns:
             Dict with baseline info or None if no baseline set
         """
-        if not self.current_baseline:
+        entry = self._get_baseline(person_id)
+        if entry is None:
             return None
+        baseline_data = entry[2]
         
         return {
-            'person_id': self.current_baseline['person_id'],
-            'timestamp': self.current_baseline['timestamp'],
-            'total_aus': self.current_baseline['total_aus_detected'],
-            'analyzer': self.current_baseline['analyzer'],
+            'person_id': baseline_data['person_id'],
+            'timestamp': baseline_data['timestamp'],
+            'total_aus': baseline_data['total_aus_detected'],
+            'analyzer': baseline_data['analyzer'],
             'age_minutes': round((time.time() - 
-                               datetime.fromisoformat(self.current_baseline['timestamp']).timestamp()) / 60, 1)
+                               datetime.fromisoformat(baseline_data['timestamp']).timestamp()) / 60, 1)
         }
     
+    def _baseline_file(self, person_id: str) -> str:
+        """Return the baseline file path for a person"""
+        return os.path.join(self.baseline_dir, f"{person_id}_baseline.json")
+    
+    def _get_baseline(self, person_id: Optional[str]):
+        """Return the cached baseline entry for person_id (or the current person), or None"""
+        if person_id is None:
+            person_id = self.current_person
+            if person_id is None:
+                return None
+        try:
+            return self._load_cached(person_id)
+        except Exception as e:
+            logging.error(f"Failed to load baseline for {person_id}: {e}")
+            return None
+    
+    def _load_cached(self, person_id: str):
+        """
+        Return (mtime, AU vector, data) for a person's baseline, or None if there is none
+        
+        The file is only parsed again when its mtime differs from the cached
+        one, so repeated delta calls don't re-read JSON.
+        """
+        with self._baselines_lock:
+            entry = self._baselines.get(person_id)
+        # A baseline set in this process whose write is still pending is authoritative
+        if entry is not None and entry[0] is None:
+            return entry
+        
+        baseline_file = self._baseline_file(person_id)
+        try:
+            mtime = os.path.getmtime(baseline_file)
+        except OSError:
+            return None
+        if entry is not None and entry[0] == mtime:
+            return entry
+        
+        with open(baseline_file, 'rb') as f:
+            baseline_data = orjson.loads(f.read())
+        entry = (mtime, _au_vector(baseline_data['action_units']), baseline_data)
+        with self._baselines_lock:
+            self._baselines[person_id] = entry
+        return entry
+    
+    def _reset_writer(self) -> None:
+        """Forget any writer thread and start from an empty queue"""
+        self._write_q = queue.Queue()
+        self._writer: Optional[threading.Thread] = None
+        self._writer_pid: Optional[int] = None
+        self._writer_lock = threading.Lock()
+    
+    def _after_fork(self) -> None:
+        """In a forked child: drop the parent's writer state and locks"""
+        # The parent's thread is gone and its locks may have been held at the
+        # fork; the parent still persists whatever it had queued
+        self._baselines_lock = threading.Lock()
+        self._reset_writer()
+    
+    def _writer_alive(self) -> bool:
+        """Whether this process has a running writer thread"""
+        return (self._writer is not None and self._writer_pid == os.getpid()
+                and self._writer.is_alive())
+    
+    def _enqueue_write(self, baseline_file: str, baseline_data: Optional[Dict[str, Any]]) -> None:
+        """Hand a write to the writer thread, starting it if needed"""
+        with self._writer_lock:
+            if not self._writer_alive():
+                try:
+                    writer = threading.Thread(target=self._flush_worker, name='baseline-writer', daemon=True)
+                    writer.start()
+                except RuntimeError:
+                    # No new threads (e.g. during interpreter shutdown): write inline
+                    self._write_file_logged(baseline_file, baseline_data)
+                    return
+                self._writer = writer
+                self._writer_pid = os.getpid()
+            self._write_q.put((baseline_file, baseline_data))
+    
+    def _flush_worker(self) -> None:
+        """Background thread: persist queued baseline writes"""
+        while True:
+            pending = {}
+            baseline_file, baseline_data = self._write_q.get()
+            pending[baseline_file] = baseline_data
+            count = 1
+            
+            # Coalesce anything queued meanwhile - only the latest state of each file matters
+            while True:
+                try:
+                    baseline_file, baseline_data = self._write_q.get_nowait()
+                except queue.Empty:
+                    break
+                pending[baseline_file] = baseline_data
+                count += 1
+            
+            for baseline_file, baseline_data in pending.items():
+                self._write_file_logged(baseline_file, baseline_data)
+            
+            for _ in range(count):
+                self._write_q.task_done()
+    
+    def _write_file_logged(self, baseline_file: str, baseline_data: Optional[Dict[str, Any]]) -> None:
+        """_write_file, logging rather than raising on failure"""
+        try:
+            self._write_file(baseline_file, baseline_data)
+        except Exception as e:
+            logging.error(f"Failed to persist baseline {baseline_file}: {e}")
+    
+    def _write_file(self, baseline_file: str, baseline_data: Optional[Dict[str, Any]]) -> None:
+        """Write baseline data to file, or remove the file when data is None"""
+        if baseline_data is None:
+            if os.path.exists(baseline_file):
+                os.remove(baseline_file)
+            return
+        
+        # Write to a temp file and rename so readers never see a partial file
+        # (per process, as several workers may write the same baseline)
+        temp_file = f"{baseline_file}.{os.getpid()}.tmp"
+        try:
+            with open(temp_file, 'wb') as f:
+                f.write(orjson.dumps(baseline_data, option=orjson.OPT_SERIALIZE_NUMPY))
+            os.replace(temp_file, baseline_file)
+        finally:
+            # Only still there if the write or rename failed
+            if os.path.exists(temp_file):
+                os.remove(temp_file)
+        
+        # The cached copy now matches the file; record its mtime so later
+        # lookups can tell when the file is changed by someone else
+        mtime = os.path.getmtime(baseline_file)
+        person_id = baseline_data.get('person_id')
+        with self._baselines_lock:
+            entry = self._baselines.get(person_id)
+            if entry is not None and entry[2] is baseline_data:
+                self._baselines[person_id] = (mtime, entry[1], entry[2])
+    
+    def _drain(self, timeout: Optional[float] = None) -> bool:
+        """
+        Block until all queued baseline writes have been persisted
+        
+        Args:
+            timeout: Give up after this many seconds (default: wait indefinitely)
+            
+        Returns:
+            bool: True if nothing is left pending
+        """
+        if not self._writer_alive():
+            # Without a writer in this process nothing queued here is pending
+            return True
+        
+        write_q = self._write_q
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with write_q.all_tasks_done:
+            while write_q.unfinished_tasks:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    logging.warning(f"{write_q.unfinished_tasks} baseline writes still pending")
+                    return False
+                write_q.all_tasks_done.wait(remaining)
+        return True
+    
     def _is_valid_facs_result(self, facs_result: Dict[str, Any]) -> bool:
         """Validate FACS result structure"""
         return (
@@ -245,13 +486,18 @@ class BaselineManager:
         else:
             return 'major'
     
-    def _detect_movement_patterns(self, deltas: Dict[str, Dict]) -> list:
-        """Detect common movement patterns from deltas"""
+    def _detect_movement_patterns(self, delta_vec: np.ndarray) -> list:
+        """
+        Detect common movement patterns from deltas
+        
+        Args:
+            delta_vec: Rounded AU deltas aligned to AU_ORDER (extra AUs may follow)
+        """
         patterns = []
         
         # Smile pattern: AU12 increase, possibly with AU06
-        au12_delta = deltas.get('AU12', {}).get('delta', 0)
-        au06_delta = deltas.get('AU06', {}).get('delta', 0)
+        au12_delta = float(delta_vec[AU12_IDX])
+        au06_delta = float(delta_vec[AU06_IDX])
         
         if au12_delta > 0.3:
             if au06_delta > 0.2:
@@ -268,8 +514,8 @@ class BaselineManager:
                 })
         
         # Frown pattern: AU15 increase or AU04 increase
-        au15_delta = deltas.get('AU15', {}).get('delta', 0)
-        au04_delta = deltas.get('AU04', {}).get('delta', 0)
+        au15_delta = float(delta_vec[AU15_IDX])
+        au04_delta = float(delta_vec[AU04_IDX])
         
         if au15_delta > 0.3 or au04_delta > 0.3:
             patterns.append({
@@ -278,10 +524,9 @@ class BaselineManager:
                 'intensity': max(au15_delta, au04_delta)
             })
         
-        # Surprise pattern: AU01 + AU02 + AU26
-        au01_delta = deltas.get('AU01', {}).get('delta', 0)
-        au02_delta = deltas.get('AU02', {}).get('delta', 0)
-        au26_delta = deltas.get('AU26', {}).get('delta', 0)
+        # Brow flash pattern: AU01 + AU02
+        au01_delta = float(delta_vec[AU01_IDX])
+        au02_delta = float(delta_vec[AU02_IDX])
         
         if au01_delta > 0.2 and au02_delta > 0.2:
             patterns.append({
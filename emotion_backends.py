@@ -1,12 +1,115 @@
 from abc import ABC, abstractmethod
 import cv2
+import functools
 import logging
 import numpy as np
+import operator
+import os
+import threading
+from thread_limits import limit_native_threads
+
+# Explicit GPU placement is opt-in so CPU-only deployments work unchanged
+USE_GPU = os.environ.get('USE_GPU') == '1'
+if USE_GPU:
+    # Grow GPU memory on demand instead of every worker reserving all of it
+    os.environ.setdefault('TF_FORCE_GPU_ALLOW_GROWTH', 'true')
+
+# Native thread pools were capped by the entry point before NumPy loaded (see
+# thread_limits); OpenCV's pool can still be sized now
+BACKEND_THREADS = limit_native_threads()
+cv2.setNumThreads(BACKEND_THREADS)
+
+# Uploads larger than this are downscaled before analysis; the face detectors
+# gain nothing from multi-megapixel inputs but pay for every pixel
+MAX_IMAGE_DIM = 1280
+
+_scratch = threading.local()
+
+def analysis_shape(h, w):
+    """
+    Return the (height, width) an h x w image is analyzed at
+    
+    Every way an image reaches the backends (uploads, batch files, paths)
+    is brought to this size, so scale-dependent measurements and face boxes
+    agree between endpoints.
+    
+    Returns:
+        tuple: (height, width), or None if the image is small enough already
+    """
+    scale = MAX_IMAGE_DIM / max(h, w)
+    if scale >= 1.0:
+        return None
+    return max(1, round(h * scale)), max(1, round(w * scale))
+
+def read_image(image_path, flags=cv2.IMREAD_COLOR):
+    """
+    Decode an image file at the size it is analyzed at (see analysis_shape)
+    
+    Unlike preprocess the result is a fresh array, safe to hand to other
+    threads.
+    
+    Returns:
+        np.ndarray: Decoded (possibly downscaled) image, or None if unreadable
+    """
+    img = cv2.imread(image_path, flags)
+    if img is None:
+        return None
+    shape = analysis_shape(*img.shape[:2])
+    if shape is None:
+        return img
+    return cv2.resize(img, (shape[1], shape[0]), interpolation=cv2.INTER_AREA)
+
+def preprocess(img):
+    """
+    Downscale an oversized decoded image into a reusable per-thread buffer
+    
+    Steady streams of same-sized uploads (e.g. camera frames) resize into the
+    same buffer every time instead of allocating a new array per request. The
+    returned view is only valid until the calling thread preprocesses its
+    next image.
+    
+    Returns:
+        tuple: (image, scale) where scale is the factor applied (1.0 if unchanged)
+    """
+    h, w = img.shape[:2]
+    size = analysis_shape(h, w)
+    if size is None:
+        return img, 1.0
+    
+    scale = MAX_IMAGE_DIM / max(h, w)
+    shape = size + img.shape[2:]
+    out = getattr(_scratch, 'buf', None)
+    if out is None or out.shape != shape or out.dtype != img.dtype:
+        out = np.empty(shape, dtype=img.dtype)
+        _scratch.buf = out
+    cv2.resize(img, (shape[1], shape[0]), dst=out, interpolation=cv2.INTER_AREA)
+    return out, scale
+
+# The emotion labels every emotion backend reports, in sorted order. Pairs of
+# results that both use exactly this set are compared without any key
+# intersection (see image_processor.compare_results)
+EMOTION_KEYS = ('anger', 'disgust', 'fear', 'happiness', 'neutral', 'sadness', 'surprise')
+EMOTION_KEY_SET = frozenset(EMOTION_KEYS)
+
+_score = operator.itemgetter(1)
+
+def _dominant_emotion(emotions):
+    """
+    Return the (emotion, score) pair with the highest score
+    
+    Scores are already rounded, so the score doubles as the confidence.
+    For seven labels a single builtin max over the items is faster than
+    building a NumPy array for argmax; ties go to the first label, as before.
+    """
+    return max(emotions.items(), key=_score)
 
 class EmotionDetector(ABC):
     """Abstract base class for emotion detection backends"""
     
-    @abstractmethod
+    # What the results describe, so callers can dispatch on a plain attribute
+    # instead of probing for methods: 'emotion' here, 'facs' for FACSAnalyzer
+    capability = 'emotion'
+    
     def detect(self, image_path):
         """
         Detect emotions in an image
@@ -14,6 +117,27 @@ class EmotionDetector(ABC):
         Args:
             image_path (str): Path to the image file
             
+        Returns:
+            dict: Dictionary containing emotions and dominant_emotion
+        """
+        logging.info(f"{self.get_backend_name()} analyzing image: {image_path}")
+        img = read_image(image_path)
+        if img is None:
+            return {
+                'error': f'{self.get_backend_name()} error analyzing image: Failed to load image',
+                'backend': self.get_backend_name(),
+                'face_detected': False
+            }
+        return self.detect_array(img)
+    
+    @abstractmethod
+    def detect_array(self, img):
+        """
+        Detect emotions in an already decoded image
+        
+        Args:
+            img (np.ndarray): BGR image as returned by cv2.imread/cv2.imdecode
+            
         Returns:
             dict: Dictionary containing emotions and dominant_emotion
         """
@@ -23,27 +147,130 @@ class EmotionDetector(ABC):
     def get_backend_name(self):
         """Return the name of this backend"""
         pass
+    
+    def detect_batch(self, image_paths):
+        """
+        Detect emotions in a list of image files, one at a time
+        
+        Args:
+            image_paths (list): Paths to the image files
+            
+        Returns:
+            list: One detect() result dict per image, in input order
+        """
+        return [self.detect(image_path) for image_path in image_paths]
+    
+    def detect_array_batch(self, imgs):
+        """
+        Detect emotions in a list of already decoded images, one at a time
+        
+        This is the hook for a backend that can run several images through
+        one forward pass, but none does yet: FER only exposes per-image
+        detect_emotions (its classifier is library-internal), and DeepFace
+        only accepts list input in releases newer than requirements.txt
+        allows. Every backend uses this loop.
+        
+        Args:
+            imgs (list): BGR images as returned by cv2.imread/cv2.imdecode
+            
+        Returns:
+            list: One detect_array() result dict per image, in input order
+        """
+        return [self.detect_array(img) for img in imgs]
+
+# One FER model per process, however many FERDetector instances exist
+_FER_LOAD_LOCK = threading.Lock()
+_FER_LOCK = threading.Lock()
+
+def _shared_fer():
+    """Return the process-wide FER model, built and compiled on first use"""
+    with _FER_LOAD_LOCK:
+        return _load_fer()
+
+@functools.lru_cache(maxsize=1)
+def _load_fer():
+    detector = _create_fer()
+    _compile_classifier(detector)
+    return detector
+
+def _create_fer():
+    """Build the FER detector, pinned to the GPU when USE_GPU=1"""
+    from fer import FER
+    if not USE_GPU:
+        return FER(mtcnn=True)
+    
+    import tensorflow as tf
+    gpus = tf.config.list_physical_devices('GPU')
+    logging.info(f"FER GPU devices: {gpus}")
+    if not gpus:
+        logging.warning("USE_GPU=1 but TensorFlow sees no GPU; FER will run on CPU")
+        return FER(mtcnn=True)
+    
+    with tf.device('/GPU:0'):
+        detector = FER(mtcnn=True)
+    
+    # FER's MTCNN face finder is facenet-pytorch, which defaults to the CPU
+    import torch
+    if torch.cuda.is_available():
+        from facenet_pytorch import MTCNN
+        detector._mtcnn = MTCNN(keep_all=True, device='cuda')
+    return detector
+
+def _compile_classifier(detector):
+    """
+    Route FER's emotion CNN through a compiled tf.function
+    
+    FER calls its Keras model eagerly for every image; tracing it once as a
+    graph (XLA-compiled when a GPU is present) removes the per-call eager
+    dispatch. This relies on where fer 22.x keeps the model and on its
+    _classify_emotions hook; if either is missing, or the compiled call
+    fails, FER's own path is used and a warning is logged.
+    """
+    if getattr(detector, 'tfserving', False):
+        return
+    model = getattr(detector, '_FER__emotion_classifier', None)
+    original = getattr(detector, '_classify_emotions', None)
+    if model is None or not callable(original):
+        logging.warning("FER classifier compilation skipped: unrecognized fer internals, "
+                        "using the uncompiled model")
+        return
+    try:
+        import tensorflow as tf
+        jit_compile = bool(tf.config.list_physical_devices('GPU'))
+        predict = tf.function(model, jit_compile=jit_compile, reduce_retracing=True)
+    except Exception as e:
+        logging.warning(f"FER classifier compilation skipped: {e}")
+        return
+    
+    def classify(gray_faces):
+        try:
+            return predict(gray_faces).numpy()
+        except Exception as e:
+            # Put FER's own path back for good rather than failing every image
+            logging.warning(f"Compiled FER classifier failed, using the uncompiled model: {e}")
+            detector._classify_emotions = original
+            return original(gray_faces)
+    
+    detector._classify_emotions = classify
 
 class FERDetector(EmotionDetector):
     """FER (Facial Emotion Recognition) library detector - Real implementation"""
     
     def __init__(self):
         self.backend_name = "FER"
-        from fer import FER
-        self.detector = FER(mtcnn=True)
+        self.detector = _shared_fer()
+        # The shared model is called from several threads; MTCNN and the
+        # Keras classifier are not safe to run concurrently
+        self._lock = _FER_LOCK
     
     def get_backend_name(self):
         return self.backend_name
     
-    def detect(self, image_path):
+    def detect_array(self, img):
         try:
-            logging.info(f"FER analyzing image: {image_path}")
-            img = cv2.imread(image_path)
-            if img is None:
-                raise ValueError("Failed to load image")
-            
             # Real FER emotion detection
-            result = self.detector.detect_emotions(img)
+            with self._lock:
+                result = self.detector.detect_emotions(img)
             
             if not result:
                 return {
@@ -67,7 +294,7 @@ class FERDetector(EmotionDetector):
                 'happiness': round(float(face_emotions.get('happy', 0.0)), 2)
             }
             
-            dominant_emotion = max(normalized_emotions, key=normalized_emotions.get)
+            dominant_emotion, confidence = _dominant_emotion(normalized_emotions)
             
             # Real FER emotion detection completed
             
@@ -75,7 +302,7 @@ class FERDetector(EmotionDetector):
                 'emotions': normalized_emotions,
                 'dominant_emotion': dominant_emotion,
                 'backend': self.backend_name,
-                'confidence_score': round(float(normalized_emotions[dominant_emotion]), 2),
+                'confidence_score': confidence,
                 'face_detected': True,
                 'box': result[0].get('box', None)  # Face bounding box
             }
@@ -94,6 +321,9 @@ class DeepFaceDetector(EmotionDetector):
         self.backend_name = "DeepFace"
         # Lazy import to handle potential installation issues
         self._deepface = None
+        # DeepFace builds its models lazily on first use; serialize calls so
+        # concurrent requests don't race that initialization
+        self._lock = threading.Lock()
     
     def get_backend_name(self):
         return self.backend_name
@@ -139,82 +369,100 @@ class DeepFaceDetector(EmotionDetector):
         
         return normalized
     
-    def detect(self, image_path):
+    def detect_array(self, img):
         try:
-            logging.info(f"DeepFace analyzing image: {image_path}")
-            DeepFace = self._get_deepface()
-            
-            # Create a temporary copy with safe filename for DeepFace
-            import os
-            import shutil
-            import tempfile
-            
-            # Create temporary file with safe name
-            temp_dir = tempfile.gettempdir()
-            safe_filename = f"deepface_temp_{os.getpid()}_{hash(image_path) % 10000}.jpg"
-            temp_path = os.path.join(temp_dir, safe_filename)
-            
-            try:
-                # Copy original file to temp location with safe name
-                shutil.copy2(image_path, temp_path)
-                
-                # Analyze with enforce_detection=False to handle no-face cases gracefully
-                result = DeepFace.analyze(
-                    img_path=temp_path, 
-                    actions=['emotion'], 
-                    enforce_detection=False,
-                    silent=True
-                )
-            finally:
-                # Clean up temp file
-                if os.path.exists(temp_path):
-                    os.remove(temp_path)
-            
-            # DeepFace returns a list, get first result
-            if isinstance(result, list):
-                result = result[0]
-            
-            # Extract emotion data
-            emotions = result.get('emotion', {})
-            if not emotions:
-                return {
-                    'error': 'No emotions detected',
-                    'backend': self.backend_name,
-                    'face_detected': False
-                }
-            
-            # Normalize emotion names and scores to match FER format
-            normalized_emotions = self._normalize_emotion_names(emotions)
-            
-            # Find dominant emotion
-            dominant_emotion = max(normalized_emotions, key=normalized_emotions.get)
-            
-            return {
-                'emotions': normalized_emotions,
-                'dominant_emotion': dominant_emotion,
-                'backend': self.backend_name,
-                'confidence_score': round(float(normalized_emotions[dominant_emotion]), 2),
-                'face_detected': True,
-                'region': result.get('region', {})  # Face bounding box info
-            }
-            
-        except ImportError as e:
+            return self._analyze(img)
+        except Exception as e:
+            return self._error_result(e)
+    
+    def _error_result(self, e):
+        """Build the error result for an exception raised during analysis"""
+        if isinstance(e, ImportError):
             return {
                 'error': f'DeepFace not available: {str(e)}',
                 'backend': self.backend_name,
                 'face_detected': False
             }
-        except Exception as e:
-            logging.error(f"DeepFace error analyzing image: {str(e)}", exc_info=True)
+        logging.error(f"DeepFace error analyzing image: {str(e)}", exc_info=True)
+        return {
+            'error': f'DeepFace error analyzing image: {str(e)}',
+            'backend': self.backend_name,
+            'face_detected': False
+        }
+    
+    def _analyze(self, img):
+        """Run DeepFace on a decoded image and normalize the result"""
+        DeepFace = self._get_deepface()
+        
+        # DeepFace accepts a BGR ndarray directly, so no temporary file is needed.
+        # Analyze with enforce_detection=False to handle no-face cases gracefully
+        with self._lock:
+            result = DeepFace.analyze(
+                img_path=img, 
+                actions=['emotion'], 
+                detector_backend='opencv',  # fastest face detector; TF uses the GPU when present
+                enforce_detection=False,
+                silent=True
+            )
+        
+        # DeepFace returns a list, get first result
+        if isinstance(result, list):
+            result = result[0]
+        
+        # Extract emotion data
+        emotions = result.get('emotion', {})
+        if not emotions:
             return {
-                'error': f'DeepFace error analyzing image: {str(e)}',
+                'error': 'No emotions detected',
                 'backend': self.backend_name,
                 'face_detected': False
             }
+        
+        # Normalize emotion names and scores to match FER format
+        normalized_emotions = self._normalize_emotion_names(emotions)
+        
+        # Find dominant emotion
+        dominant_emotion, confidence = _dominant_emotion(normalized_emotions)
+        
+        return {
+            'emotions': normalized_emotions,
+            'dominant_emotion': dominant_emotion,
+            'backend': self.backend_name,
+            'confidence_score': confidence,
+            'face_detected': True,
+            'region': result.get('region', {})  # Face bounding box info
+        }
+
+# One detector per backend per process - model loading is far too slow to
+# repeat per request
+_DETECTOR_CACHE = {}
+_DETECTOR_LOCK = threading.Lock()
 
 def get_detector(backend_name):
+    """Return the shared emotion detector for a backend, creating it on first use"""
+    name = backend_name.lower()
+    detector = _DETECTOR_CACHE.get(name)
+    if detector is None:
+        with _DETECTOR_LOCK:
+            # Re-check: another thread may have built it while we waited
+            detector = _DETECTOR_CACHE.get(name)
+            if detector is None:
+                detector = _create_detector(name)
+                _DETECTOR_CACHE[name] = detector
+    return detector
+
+def _create_detector(backend_name):
     """Factory function to get emotion detector by name"""
-    detectors = {
+    factories = _detector_factories()
+    if backend_name.lower() not in factories:
+        raise ValueError(f"Unknown backend: {backend_name}. Available: {list(factories.keys())}")
+    
+    return factories[backend_name.lower()]()
+
+@functools.lru_cache(maxsize=1)
+def _detector_factories():
+    """Map backend names to constructors; nothing is instantiated until requested"""
+    factories = {
         'fer': FERDetector,
         'deepface': DeepFaceDetector
     }
@@ -222,18 +470,26 @@ def get_detector(backend_name):
     # Add FACS analyzer if available (returns pure muscle data, not emotions)
     try:
         from facs_backend import get_facs_analyzer
-        detectors['facs'] = lambda: get_facs_analyzer(use_simple=False)
-        detectors['simplefacs'] = lambda: get_facs_analyzer(use_simple=True)
+        factories['facs'] = lambda: get_facs_analyzer(use_simple=False)
+        factories['simplefacs'] = lambda: get_facs_analyzer(use_simple=True)
     except ImportError:
         pass
     
-    if backend_name.lower() not in detectors:
-        raise ValueError(f"Unknown backend: {backend_name}. Available: {list(detectors.keys())}")
-    
-    return detectors[backend_name.lower()]()
+    return factories
 
 def get_available_backends():
     """Return list of available backend names"""
+    # Availability is a deploy-time property; probe once and reuse
+    return list(_detect_available_backends())
+
+def refresh_backends():
+    """Forget the cached backend availability and probe again"""
+    _detect_available_backends.cache_clear()
+    return get_available_backends()
+
+@functools.lru_cache(maxsize=1)
+def _detect_available_backends():
+    """Probe which backends can be imported and initialized"""
     available = ['fer']  # FER is always available
     
     # Check if DeepFace is available
@@ -245,9 +501,9 @@ def get_available_backends():
     
     # Check if FACS analyzers are available
     try:
-        from facs_backend import FACSDetector
-        detector = FACSDetector()
-        detector._get_detector()  # Try to initialize
+        # Initialize through the registry so the probed model is the one
+        # later requests reuse, rather than a throwaway second copy
+        get_detector('facs')._get_detector()
         available.append('facs')
     except:
         # If full FACS not available, try SimpleFACS
@@ -260,4 +516,4 @@ def get_available_backends():
             # Removed debug print for production
             pass
     
-    return available
\ No newline at end of file
+    return tuple(available)
@@ -1,19 +1,198 @@
 from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
 import cv2
+import functools
 import logging
 import numpy as np
 import os
 import tempfile
 import shutil
+import threading
+from types import MappingProxyType
+
+from emotion_backends import read_image
+
+
+def _roi_stats(mouth_edges, brow_edges, lower_face, texture):
+    """
+    Region statistics for SimpleFACS: edge sums and intensity/texture variances
+    
+    Uses OpenCV's SIMD reductions; Canny edge maps are 0/255, so their sums
+    are 255 times the edge-pixel count. Results are np.float64, like the
+    np.sum/np.var they replace, so round() on the derived AU intensities
+    resolves ties the same way.
+    """
+    _, lower_std = cv2.meanStdDev(lower_face)
+    _, texture_std = cv2.meanStdDev(texture)
+    return (
+        np.float64(cv2.countNonZero(mouth_edges) * 255),
+        np.float64(cv2.countNonZero(brow_edges) * 255),
+        lower_std[0, 0] ** 2,
+        texture_std[0, 0] ** 2
+    )
+
+# Shared descriptor tables; read-only so every analyzer can hand them out safely
+_AU_DESCRIPTIONS = MappingProxyType({
+    'AU01': 'Inner Brow Raiser',
+    'AU02': 'Outer Brow Raiser', 
+    'AU04': 'Brow Lowerer',
+    'AU05': 'Upper Lid Raiser',
+    'AU06': 'Cheek Raiser',
+    'AU07': 'Lid Tightener',
+    'AU09': 'Nose Wrinkler',
+    'AU10': 'Upper Lip Raiser',
+    'AU11': 'Nasolabial Deepener',
+    'AU12': 'Lip Corner Puller',
+    'AU13': 'Sharp Lip Puller',
+    'AU14': 'Dimpler',
+    'AU15': 'Lip Corner Depressor',
+    'AU16': 'Lower Lip Depressor',
+    'AU17': 'Chin Raiser',
+    'AU18': 'Lip Puckerer',
+    'AU20': 'Lip Stretcher',
+    'AU22': 'Lip Funneler',
+    'AU23': 'Lip Tightener',
+    'AU24': 'Lip Pressor',
+    'AU25': 'Lips Part',
+    'AU26': 'Jaw Drop',
+    'AU27': 'Mouth Stretch',
+    'AU28': 'Lip Suck'
+})
+
+_MUSCLE_GROUPS = MappingProxyType({
+    'AU01': 'corrugator supercilii (medial)',
+    'AU02': 'frontalis (lateral)', 
+    'AU04': 'corrugator supercilii, depressor supercilii',
+    'AU05': 'levator palpebrae superioris',
+    'AU06': 'orbicularis oculi (pars orbitalis)',
+    'AU07': 'orbicularis oculi (pars palpebralis)',
+    'AU09': 'levator labii superioris alaeque nasi',
+    'AU10': 'levator labii superioris',
+    'AU12': 'zygomaticus major',
+    'AU15': 'depressor anguli oris',
+    'AU17': 'mentalis',
+    'AU20': 'risorius',
+    'AU23': 'orbicularis oris',
+    'AU25': 'depressor labii inferioris',
+    'AU26': 'masseter (relaxed)',
+    'AU28': 'orbicularis oris'
+})
+
+# Decodes run here so they overlap model loading (OpenCV releases the GIL)
+_io_pool = ThreadPoolExecutor(max_workers=4, thread_name_prefix='facs-io')
+
+# Most images handed to py-feat's models in one forward pass
+FEAT_BATCH_SIZE = 8
+
+# Models are loaded once per process and shared by every analyzer instance;
+# each has its own load lock so a slow or failing py-feat load (which is not
+# cached and so retried) never holds up the Haar cascades
+_FEAT_LOAD_LOCK = threading.Lock()
+_CASCADE_LOAD_LOCK = threading.Lock()
+# py-feat's Detector is not safe for concurrent inference
+_FEAT_LOCK = threading.Lock()
+
+def _shared_feat_detector():
+    """Return the process-wide py-feat Detector, loading it on first use"""
+    with _FEAT_LOAD_LOCK:
+        return _load_feat_detector()
+
+@functools.lru_cache(maxsize=1)
+def _load_feat_detector():
+    from feat import Detector
+    detector = Detector(
+        face_model="retinaface",
+        landmark_model="mobilefacenet", 
+        au_model="xgb",  # XGBoost model for Action Units
+        emotion_model="resmasknet",
+        facepose_model="img2pose"
+    )
+    logging.info("FACS detector initialized successfully")
+    return detector
+
+# OpenCV's built-in (face, eye) cascades, parsed once per process by _load_cascades
+CASCADE_PATHS = (
+    cv2.data.haarcascades + 'haarcascade_frontalface_default.xml',
+    cv2.data.haarcascades + 'haarcascade_eye.xml'
+)
+
+def _shared_cascades():
+    """Return the process-wide (face, eye) Haar cascades"""
+    with _CASCADE_LOAD_LOCK:
+        return _load_cascades()
+
+@functools.lru_cache(maxsize=1)
+def _load_cascades():
+    cascades = tuple(cv2.CascadeClassifier(path) for path in CASCADE_PATHS)
+    for path, cascade in zip(CASCADE_PATHS, cascades):
+        if cascade.empty():
+            # Raising keeps the failure out of the cache, so a later call retries
+            raise RuntimeError(f"Failed to load Haar cascade: {path}")
+    logging.info("SimpleFACS detector initialized with OpenCV cascades")
+    return cascades
+
+_scratch = threading.local()
+
+def _scratch_buffer(name, shape, dtype=np.uint8):
+    """
+    Return a reusable per-thread array for intermediate results
+    
+    Each name is backed by a flat buffer that only grows, so faces of
+    varying size keep reusing one allocation. The array is only valid until
+    the calling thread asks for the same name again.
+    """
+    size = int(np.prod(shape))
+    buf = getattr(_scratch, name, None)
+    if buf is None or buf.size < size or buf.dtype != dtype:
+        buf = np.empty(size, dtype=dtype)
+        setattr(_scratch, name, buf)
+    return buf[:size].reshape(shape)
 
 class FACSAnalyzer(ABC):
     """Base class for FACS (Facial Action Coding System) analysis - purely descriptive"""
     
-    @abstractmethod
+    # Pure muscle data rather than emotion predictions (see EmotionDetector.capability)
+    capability = 'facs'
+    
+    # Known AU combinations: (pattern, required AUs, minimum intensities that
+    # must be exceeded, AUs that must be absent, description)
+    _COMBOS = (
+        ('Duchenne Smile', ('AU06', 'AU12'), (0.3, 0.3), (),
+         'Genuine smile involving both cheek raiser and lip corner puller'),
+        ('Pan Am Smile', ('AU12',), (0.4,), ('AU06',),
+         'Social smile - lip corners only, no eye involvement'),
+        ('Brow Flash', ('AU01', 'AU02'), (0.4, 0.4), (),
+         'Eyebrow raise often used in greeting or emphasis'),
+        ('Frown Pattern', ('AU15', 'AU04'), (), (),
+         'Downturned mouth with lowered brow'),
+    )
+    
     def analyze(self, image_path):
         """
         Analyze facial action units in an image
         
+        Returns:
+            dict: Pure FACS data without emotion inference
+        """
+        logging.info(f"{self.get_analyzer_name()} analyzing image: {image_path}")
+        # Decode on the I/O pool while the models load (a no-op once warm)
+        pending = _io_pool.submit(read_image, image_path)
+        self._warm_up()
+        img = pending.result()
+        if img is None:
+            return {
+                'error': f'{self.get_analyzer_name()} error: Failed to load image: {image_path}',
+                'analyzer': self.get_analyzer_name(),
+                'face_detected': False,
+                'analysis_type': 'pure_facs'
+            }
+        return self.analyze_array(img)
+    
+    @abstractmethod
+    def analyze_array(self, img):
+        """
+        Analyze facial action units in an already decoded BGR image
+        
         Returns:
             dict: Pure FACS data without emotion inference
         """
@@ -23,10 +202,66 @@ class FACSAnalyzer(ABC):
     def get_analyzer_name(self):
         """Return the name of this analyzer"""
         pass
+    
+    def _warm_up(self):
+        """Load this analyzer's models ahead of the first analysis"""
+        pass
+    
+    def analyze_batch(self, image_paths):
+        """
+        Analyze facial action units in a batch of images
+        
+        Returns:
+            list: One analyze() result dict per image, in input order
+        """
+        return [self.analyze(image_path) for image_path in image_paths]
+    
+    def analyze_array_batch(self, imgs):
+        """
+        Analyze facial action units in a batch of already decoded BGR images
+        
+        Returns:
+            list: One analyze_array() result dict per image, in input order
+        """
+        return [self.analyze_array(img) for img in imgs]
+    
+    def _get_au_descriptions(self):
+        """Return detailed descriptions of Action Units"""
+        return _AU_DESCRIPTIONS
+    
+    def _detect_facs_combinations(self, action_units):
+        """Detect known FACS combinations and patterns"""
+        combinations = []
+        for pattern, required, thresholds, excluded, description in self._COMBOS:
+            if not all(au in action_units for au in required):
+                continue
+            if any(au in action_units for au in excluded):
+                continue
+            intensities = [action_units[au]['intensity'] for au in required]
+            if not all(value > t for value, t in zip(intensities, thresholds)):
+                continue
+            combinations.append({
+                'pattern': pattern,
+                'aus': list(required),
+                'description': description,
+                'intensity': round(sum(intensities) / len(intensities), 2) if len(intensities) > 1 else intensities[0]
+            })
+        return combinations
+    
+    def _get_muscle_group(self, au_code):
+        """Return the muscle group for an Action Unit"""
+        return _MUSCLE_GROUPS.get(au_code, 'Unknown muscle group')
 
 class FACSDetector(FACSAnalyzer):
     """FACS (Facial Action Coding System) detector using py-feat"""
     
+    # AU intensity columns py-feat can emit, in its column order
+    _AU_COLS = tuple('AU{:02d}'.format(n) for n in (
+        1, 2, 4, 5, 6, 7, 9, 10, 11, 12, 13, 14, 15, 16, 17, 18,
+        20, 22, 23, 24, 25, 26, 27, 28, 43
+    ))
+    _BOX_COLS = ('FaceRectX', 'FaceRectY', 'FaceRectWidth', 'FaceRectHeight')
+    
     def __init__(self):
         self.analyzer_name = "FACS"
         self._detector = None
@@ -39,21 +274,19 @@ class FACSDetector(FACSAnalyzer):
         """Lazy load py-feat detector to handle import errors gracefully"""
         if self._detector is None:
             try:
-                from feat import Detector
-                self._detector = Detector(
-                    face_model="retinaface",
-                    landmark_model="mobilefacenet", 
-                    au_model="xgb",  # XGBoost model for Action Units
-                    emotion_model="resmasknet",
-                    facepose_model="img2pose"
-                )
-                logging.info("FACS detector initialized successfully")
+                self._detector = _shared_feat_detector()
             except ImportError as e:
                 raise ImportError(f"py-feat not installed. Install with: pip install py-feat\nError: {e}")
             except Exception as e:
                 raise Exception(f"Failed to initialize FACS detector: {e}")
         return self._detector
     
+    def _warm_up(self):
+        try:
+            self._get_detector()
+        except Exception:
+            pass  # analyze_array reports the failure in its result
+    
     def _action_units_to_emotions(self, action_units):
         """
         Map FACS Action Units to basic emotions based on Ekman's research
@@ -126,74 +359,27 @@ class FACSDetector(FACSAnalyzer):
         
         return emotions
     
-    def analyze(self, image_path):
+    def analyze_array(self, img):
         """
         Detect FACS Action Units - purely descriptive, no emotion inference
         
         Returns raw facial muscle activation data
         """
         try:
-            logging.info(f"FACS analyzing image: {image_path}")
             detector = self._get_detector()
             
-            # Load image
-            img = cv2.imread(image_path)
-            if img is None:
-                raise ValueError(f"Failed to load image: {image_path}")
-            
-            # Convert BGR to RGB (py-feat expects RGB)
-            img_rgb = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+            # BGR -> RGB as a stride-reversed view, not a copy (py-feat expects RGB)
+            img_rgb = img[..., ::-1]
             
             # Detect faces and extract features
-            result = detector.detect_image(img_rgb)
-            
-            if result is None or result.empty:
-                return {
-                    'error': 'No face detected',
-                    'backend': self.backend_name,
-                    'face_detected': False
-                }
-            
-            # Get the first face's data
-            face_data = result.iloc[0]
+            with _FEAT_LOCK:
+                try:
+                    result = detector.detect_image(img_rgb)
+                except ValueError:
+                    # torch.from_numpy rejects negative strides; materialize only then
+                    result = detector.detect_image(np.ascontiguousarray(img_rgb))
             
-            # Extract Action Units (AU01-AU43) with detailed information
-            action_units = {}
-            au_descriptions = self._get_au_descriptions()
-            
-            for col in result.columns:
-                if col.startswith('AU') and not col.endswith('_c'):  # Get intensity values, not classifications
-                    au_value = face_data[col]
-                    if not np.isnan(au_value) and au_value > 0.1:  # Only include significant activations
-                        action_units[col] = {
-                            'intensity': round(float(au_value), 3),
-                            'description': au_descriptions.get(col, 'Unknown Action Unit'),
-                            'muscle_group': self._get_muscle_group(col)
-                        }
-            
-            # Detect known FACS combinations
-            facs_combinations = self._detect_facs_combinations(action_units)
-            
-            # Get face bounding box
-            bbox = None
-            if 'FaceRectX' in result.columns:
-                bbox = {
-                    'x': int(face_data['FaceRectX']),
-                    'y': int(face_data['FaceRectY']),
-                    'width': int(face_data['FaceRectWidth']),
-                    'height': int(face_data['FaceRectHeight'])
-                }
-            
-            return {
-                'action_units': action_units,
-                'facs_combinations': facs_combinations,
-                'analyzer': self.analyzer_name,
-                'face_detected': True,
-                'box': bbox,
-                'analysis_type': 'pure_facs',
-                'total_aus_detected': len(action_units),
-                'note': 'Pure FACS analysis - no emotion inference'
-            }
+            return self._rows_to_result(result)
             
         except ImportError as e:
             return {
@@ -211,101 +397,104 @@ class FACSDetector(FACSAnalyzer):
                 'analysis_type': 'pure_facs'
             }
     
-    def _get_au_descriptions(self):
-        """Return detailed descriptions of Action Units"""
-        return {
-            'AU01': 'Inner Brow Raiser',
-            'AU02': 'Outer Brow Raiser', 
-            'AU04': 'Brow Lowerer',
-            'AU05': 'Upper Lid Raiser',
-            'AU06': 'Cheek Raiser',
-            'AU07': 'Lid Tightener',
-            'AU09': 'Nose Wrinkler',
-            'AU10': 'Upper Lip Raiser',
-            'AU11': 'Nasolabial Deepener',
-            'AU12': 'Lip Corner Puller',
-            'AU13': 'Sharp Lip Puller',
-            'AU14': 'Dimpler',
-            'AU15': 'Lip Corner Depressor',
-            'AU16': 'Lower Lip Depressor',
-            'AU17': 'Chin Raiser',
-            'AU18': 'Lip Puckerer',
-            'AU20': 'Lip Stretcher',
-            'AU22': 'Lip Funneler',
-            'AU23': 'Lip Tightener',
-            'AU24': 'Lip Pressor',
-            'AU25': 'Lips Part',
-            'AU26': 'Jaw Drop',
-            'AU27': 'Mouth Stretch',
-            'AU28': 'Lip Suck'
-        }
-    
-    def _get_muscle_group(self, au_code):
-        """Return the muscle group for an Action Unit"""
-        muscle_groups = {
-            'AU01': 'corrugator supercilii (medial)',
-            'AU02': 'frontalis (lateral)', 
-            'AU04': 'corrugator supercilii, depressor supercilii',
-            'AU05': 'levator palpebrae superioris',
-            'AU06': 'orbicularis oculi (pars orbitalis)',
-            'AU07': 'orbicularis oculi (pars palpebralis)',
-            'AU09': 'levator labii superioris alaeque nasi',
-            'AU10': 'levator labii superioris',
-            'AU12': 'zygomaticus major',
-            'AU15': 'depressor anguli oris',
-            'AU17': 'mentalis',
-            'AU20': 'risorius',
-            'AU23': 'orbicularis oris',
-            'AU25': 'depressor labii inferioris',
-            'AU26': 'masseter (relaxed)',
-            'AU28': 'orbicularis oris'
-        }
-        return muscle_groups.get(au_code, 'Unknown muscle group')
-    
-    def _detect_facs_combinations(self, action_units):
-        """Detect known FACS combinations and patterns"""
-        combinations = []
+    def analyze_batch(self, image_paths):
+        """
+        Analyze a batch of images with one batched py-feat call
         
-        # Duchenne smile: AU6 + AU12
-        if 'AU06' in action_units and 'AU12' in action_units:
-            if action_units['AU06']['intensity'] > 0.3 and action_units['AU12']['intensity'] > 0.3:
-                combinations.append({
-                    'pattern': 'Duchenne Smile',
-                    'aus': ['AU06', 'AU12'],
-                    'description': 'Genuine smile involving both cheek raiser and lip corner puller',
-                    'intensity': round((action_units['AU06']['intensity'] + action_units['AU12']['intensity']) / 2, 2)
-                })
+        py-feat reads the files itself and runs its models over up to
+        FEAT_BATCH_SIZE images at a time. If the batched call fails (e.g. an
+        unreadable file, or a py-feat version that can't batch mixed image
+        sizes) the images are analyzed one at a time instead.
         
-        # Pan Am smile: AU12 only (without AU6)
-        elif 'AU12' in action_units and 'AU06' not in action_units:
-            if action_units['AU12']['intensity'] > 0.4:
-                combinations.append({
-                    'pattern': 'Pan Am Smile',
-                    'aus': ['AU12'],
-                    'description': 'Social smile - lip corners only, no eye involvement',
-                    'intensity': action_units['AU12']['intensity']
-                })
+        Returns:
+            list: One analyze() result dict per image, in input order
+        """
+        if len(image_paths) < 2:
+            return super().analyze_batch(image_paths)
+        try:
+            detector = self._get_detector()
+            with _FEAT_LOCK:
+                result = detector.detect_image(
+                    list(image_paths),
+                    batch_size=min(len(image_paths), FEAT_BATCH_SIZE)
+                )
+            rows = dict(tuple(result.groupby('input', sort=False)))
+        except ImportError:
+            return super().analyze_batch(image_paths)  # reports the error per image
+        except Exception as e:
+            logging.warning(f"FACS batch inference failed, analyzing images one at a time: {e}")
+            return super().analyze_batch(image_paths)
         
-        # Brow flash: AU1 + AU2
-        if 'AU01' in action_units and 'AU02' in action_units:
-            if action_units['AU01']['intensity'] > 0.4 and action_units['AU02']['intensity'] > 0.4:
-                combinations.append({
-                    'pattern': 'Brow Flash',
-                    'aus': ['AU01', 'AU02'],
-                    'description': 'Eyebrow raise often used in greeting or emphasis',
-                    'intensity': round((action_units['AU01']['intensity'] + action_units['AU02']['intensity']) / 2, 2)
+        results = []
+        for image_path in image_paths:
+            try:
+                results.append(self._rows_to_result(rows.get(image_path)))
+            except Exception as e:
+                logging.error(f"FACS error analyzing image: {str(e)}", exc_info=True)
+                results.append({
+                    'error': f'FACS error analyzing image: {str(e)}',
+                    'analyzer': self.analyzer_name,
+                    'face_detected': False,
+                    'analysis_type': 'pure_facs'
                 })
+        return results
+    
+    def _rows_to_result(self, result):
+        """
+        Build the FACS result dict from py-feat's rows for one image
         
-        # Frown: AU15 + AU4
-        if 'AU15' in action_units and 'AU04' in action_units:
-            combinations.append({
-                'pattern': 'Frown Pattern',
-                'aus': ['AU15', 'AU04'],
-                'description': 'Downturned mouth with lowered brow',
-                'intensity': round((action_units['AU15']['intensity'] + action_units['AU04']['intensity']) / 2, 2)
-            })
+        Args:
+            result: py-feat detection rows (one per face) for a single image
+        """
+        if result is None or result.empty:
+            return {
+                'error': 'No face detected',
+                'analyzer': self.analyzer_name,
+                'face_detected': False,
+                'analysis_type': 'pure_facs'
+            }
         
-        return combinations
+        # Get the first face's data
+        face_data = result.iloc[0]
+        
+        # Extract Action Units (AU01-AU43) with detailed information;
+        # AUs missing from this model's output reindex to NaN and drop out
+        au_cols = self._AU_COLS
+        values = face_data.reindex(au_cols).to_numpy(dtype=np.float64)
+        active = np.flatnonzero(np.isfinite(values) & (values > 0.1))  # Only significant activations
+        intensities = np.round(values[active], 3).tolist()
+        
+        action_units = {}
+        au_descriptions = _AU_DESCRIPTIONS
+        muscle_groups = _MUSCLE_GROUPS
+        
+        for i, intensity in zip(active.tolist(), intensities):
+            col = au_cols[i]
+            action_units[col] = {
+                'intensity': intensity,
+                'description': au_descriptions.get(col, 'Unknown Action Unit'),
+                'muscle_group': muscle_groups.get(col, 'Unknown muscle group')
+            }
+        
+        # Detect known FACS combinations
+        facs_combinations = self._detect_facs_combinations(action_units)
+        
+        # Get face bounding box
+        bbox = None
+        if 'FaceRectX' in result.columns:
+            box = face_data[list(self._BOX_COLS)].to_numpy(dtype=np.float64).tolist()
+            bbox = dict(zip(('x', 'y', 'width', 'height'), map(int, box)))
+        
+        return {
+            'action_units': action_units,
+            'facs_combinations': facs_combinations,
+            'analyzer': self.analyzer_name,
+            'face_detected': True,
+            'box': bbox,
+            'analysis_type': 'pure_facs',
+            'total_aus_detected': len(action_units),
+            'note': 'Pure FACS analysis - no emotion inference'
+        }
     
     def _interpret_action_units(self, action_units):
         """
@@ -355,33 +544,37 @@ class SimpleFACSDetector(FACSAnalyzer):
     def get_analyzer_name(self):
         return self.analyzer_name
     
+    def _warm_up(self):
+        try:
+            self._get_cascades()
+        except Exception as e:
+            # _analyze_gray reports the failure in its result
+            logging.warning(f"SimpleFACS warm-up failed: {str(e)}")
+    
     def _get_cascades(self):
         """Initialize OpenCV face cascades"""
         if self._face_cascade is None:
-            # Use OpenCV's built-in cascades
-            face_cascade_path = cv2.data.haarcascades + 'haarcascade_frontalface_default.xml'
-            eye_cascade_path = cv2.data.haarcascades + 'haarcascade_eye.xml'
-            
-            self._face_cascade = cv2.CascadeClassifier(face_cascade_path)
-            self._eye_cascade = cv2.CascadeClassifier(eye_cascade_path)
-            logging.info("SimpleFACS detector initialized with OpenCV cascades")
+            self._face_cascade, self._eye_cascade = _shared_cascades()
         return self._face_cascade, self._eye_cascade
     
-    def analyze(self, image_path):
+    def analyze_array(self, img):
         """
         Analyze approximate Action Units using OpenCV - purely descriptive
         """
+        gray = _scratch_buffer('gray', img.shape[:2])
+        cv2.cvtColor(img, cv2.COLOR_BGR2GRAY, dst=gray)
+        return self._analyze_gray(gray)
+    
+    def _analyze_gray(self, gray):
+        """
+        Analyze approximate Action Units in a grayscale image
+        
+        Args:
+            gray: Grayscale image
+        """
         try:
-            logging.info(f"SimpleFACS analyzing image: {image_path}")
             face_cascade, eye_cascade = self._get_cascades()
             
-            # Load and process image
-            img = cv2.imread(image_path)
-            if img is None:
-                raise ValueError(f"Failed to load image: {image_path}")
-            
-            gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
-            
             # Detect faces
             faces = face_cascade.detectMultiScale(gray, 1.1, 4)
             
@@ -404,13 +597,14 @@ class SimpleFACSDetector(FACSAnalyzer):
             raw_action_units = self._approximate_action_units(face_roi, eyes)
             
             # Convert to detailed format
-            au_descriptions = self._get_au_descriptions()
+            au_descriptions = _AU_DESCRIPTIONS
+            muscle_groups = _MUSCLE_GROUPS
             action_units = {}
             for au_code, intensity in raw_action_units.items():
                 action_units[au_code] = {
                     'intensity': intensity,
                     'description': au_descriptions.get(au_code, 'Unknown Action Unit'),
-                    'muscle_group': self._get_muscle_group(au_code),
+                    'muscle_group': muscle_groups.get(au_code, 'Unknown muscle group'),
                     'detection_method': 'OpenCV approximation'
                 }
             
@@ -448,16 +642,38 @@ class SimpleFACSDetector(FACSAnalyzer):
         # Analyze face regions for basic AUs
         # These are rough approximations based on image intensity patterns
         
-        # AU12 - Lip Corner Puller (smile detection via mouth region)
         mouth_region = face_roi[int(h*0.6):, :]
-        mouth_edges = cv2.Canny(mouth_region, 50, 150)
-        mouth_activity = np.sum(mouth_edges) / (mouth_region.shape[0] * mouth_region.shape[1])
+        brow_region = face_roi[:int(h*0.3), :]
+        lower_face = face_roi[int(h*0.7):, :]
+        
+        # Canny's Sobel pass over the mouth is done once here and reused by the
+        # frown check below (Canny accepts precomputed 16-bit derivatives).
+        # Intermediates are written into per-thread scratch buffers.
+        mouth_dx = _scratch_buffer('mouth_dx', mouth_region.shape, np.int16)
+        mouth_dy = _scratch_buffer('mouth_dy', mouth_region.shape, np.int16)
+        cv2.Sobel(mouth_region, cv2.CV_16S, 1, 0, dst=mouth_dx, ksize=3, borderType=cv2.BORDER_REPLICATE)
+        cv2.Sobel(mouth_region, cv2.CV_16S, 0, 1, dst=mouth_dy, ksize=3, borderType=cv2.BORDER_REPLICATE)
+        mouth_edges = _scratch_buffer('mouth_edges', mouth_region.shape)
+        brow_edges = _scratch_buffer('brow_edges', brow_region.shape)
+        texture = _scratch_buffer('texture', face_roi.shape, np.int16)
+        cv2.Canny(mouth_dx, mouth_dy, 50, 150, edges=mouth_edges)
+        cv2.Canny(brow_region, 30, 100, edges=brow_edges)
+        cv2.Laplacian(face_roi, cv2.CV_16S, dst=texture)  # exact for 8-bit input: |value| <= 1020
+        
+        # All region reductions
+        mouth_edge_sum, brow_edge_sum, lower_variance, face_texture = _roi_stats(
+            mouth_edges,
+            brow_edges,
+            lower_face,
+            texture
+        )
+        
+        # AU12 - Lip Corner Puller (smile detection via mouth region)
+        mouth_activity = mouth_edge_sum / (mouth_region.shape[0] * mouth_region.shape[1])
         action_units['AU12'] = round(min(1.0, mouth_activity / 50), 3)
         
         # AU01/AU02 - Brow movements (upper face region)
-        brow_region = face_roi[:int(h*0.3), :]
-        brow_edges = cv2.Canny(brow_region, 30, 100)
-        brow_activity = np.sum(brow_edges) / (brow_region.shape[0] * brow_region.shape[1])
+        brow_activity = brow_edge_sum / (brow_region.shape[0] * brow_region.shape[1])
         action_units['AU01'] = round(min(1.0, brow_activity / 40), 3)
         
         # AU04 - Brow Lowerer (inverse correlation with AU01)
@@ -475,21 +691,25 @@ class SimpleFACSDetector(FACSAnalyzer):
             action_units['AU07'] = 0.7  # Lid Tightener
         
         # AU26 - Jaw Drop (lower face analysis)
-        lower_face = face_roi[int(h*0.7):, :]
-        lower_variance = np.var(lower_face)
         action_units['AU26'] = round(min(1.0, lower_variance / 2000), 3)
         
         # Add some mock anger/disgust triggers for testing
         # Check for frown patterns (inverted smile detection)
         if action_units.get('AU12', 0) < 0.3:  # Low smile activity
             # Look for downturned mouth patterns
-            mouth_bottom = mouth_region[int(mouth_region.shape[0]*0.7):, :]
-            mouth_bottom_activity = np.sum(cv2.Canny(mouth_bottom, 30, 100))
+            bottom = int(mouth_region.shape[0]*0.7)
+            # The slice's first row must see a replicated border, as Canny on
+            # the slice would; re-derive just that row so edges match exactly
+            top_rows = mouth_region[bottom:bottom+2, :]
+            mouth_dx[bottom] = cv2.Sobel(top_rows, cv2.CV_16S, 1, 0, ksize=3, borderType=cv2.BORDER_REPLICATE)[0]
+            mouth_dy[bottom] = cv2.Sobel(top_rows, cv2.CV_16S, 0, 1, ksize=3, borderType=cv2.BORDER_REPLICATE)[0]
+            bottom_edges = _scratch_buffer('mouth_edges', mouth_dx[bottom:].shape)
+            cv2.Canny(mouth_dx[bottom:], mouth_dy[bottom:], 30, 100, edges=bottom_edges)
+            mouth_bottom_activity = np.sum(bottom_edges)
             if mouth_bottom_activity > mouth_activity * 50:  # More activity in bottom of mouth
                 action_units['AU15'] = 0.6  # Lip corner depressor (frown)
         
         # Enhanced anger detection - look for tense face patterns
-        face_texture = cv2.Laplacian(face_roi, cv2.CV_64F).var()
         if face_texture > 800:  # High texture variance = tense face
             action_units['AU04'] = max(action_units.get('AU04', 0), 0.5)  # Boost brow lowerer
             action_units['AU07'] = 0.4  # Add lid tightener
@@ -498,104 +718,38 @@ class SimpleFACSDetector(FACSAnalyzer):
         action_units = {k: v for k, v in action_units.items() if v > 0.05}
         
         return action_units
-    
-    def _get_au_descriptions(self):
-        """Return detailed descriptions of Action Units"""
-        return {
-            'AU01': 'Inner Brow Raiser',
-            'AU02': 'Outer Brow Raiser', 
-            'AU04': 'Brow Lowerer',
-            'AU05': 'Upper Lid Raiser',
-            'AU06': 'Cheek Raiser',
-            'AU07': 'Lid Tightener',
-            'AU12': 'Lip Corner Puller',
-            'AU15': 'Lip Corner Depressor',
-            'AU26': 'Jaw Drop'
-        }
-    
-    def _get_muscle_group(self, au_code):
-        """Return the muscle group for an Action Unit"""
-        muscle_groups = {
-            'AU01': 'corrugator supercilii (medial)',
-            'AU02': 'frontalis (lateral)', 
-            'AU04': 'corrugator supercilii, depressor supercilii',
-            'AU05': 'levator palpebrae superioris',
-            'AU06': 'orbicularis oculi (pars orbitalis)',
-            'AU07': 'orbicularis oculi (pars palpebralis)',
-            'AU12': 'zygomaticus major',
-            'AU15': 'depressor anguli oris',
-            'AU26': 'masseter (relaxed)'
-        }
-        return muscle_groups.get(au_code, 'Unknown muscle group')
-    
-    def _detect_facs_combinations(self, action_units):
-        """Detect known FACS combinations and patterns"""
-        combinations = []
-        
-        # Duchenne smile: AU6 + AU12
-        if 'AU06' in action_units and 'AU12' in action_units:
-            if action_units['AU06']['intensity'] > 0.3 and action_units['AU12']['intensity'] > 0.3:
-                combinations.append({
-                    'pattern': 'Duchenne Smile',
-                    'aus': ['AU06', 'AU12'],
-                    'description': 'Genuine smile involving both cheek raiser and lip corner puller',
-                    'intensity': round((action_units['AU06']['intensity'] + action_units['AU12']['intensity']) / 2, 2)
-                })
-        
-        # Pan Am smile: AU12 only (without AU6)
-        elif 'AU12' in action_units and 'AU06' not in action_units:
-            if action_units['AU12']['intensity'] > 0.4:
-                combinations.append({
-                    'pattern': 'Pan Am Smile',
-                    'aus': ['AU12'],
-                    'description': 'Social smile - lip corners only, no eye involvement',
-                    'intensity': action_units['AU12']['intensity']
-                })
-        
-        # Brow activity: AU1 + AU2
-        if 'AU01' in action_units and 'AU02' in action_units:
-            if action_units['AU01']['intensity'] > 0.4 and action_units['AU02']['intensity'] > 0.4:
-                combinations.append({
-                    'pattern': 'Brow Flash',
-                    'aus': ['AU01', 'AU02'],
-                    'description': 'Eyebrow raise often used in greeting or emphasis',
-                    'intensity': round((action_units['AU01']['intensity'] + action_units['AU02']['intensity']) / 2, 2)
-                })
-        
-        # Frown: AU15 + AU4
-        if 'AU15' in action_units and 'AU04' in action_units:
-            combinations.append({
-                'pattern': 'Frown Pattern',
-                'aus': ['AU15', 'AU04'],
-                'description': 'Downturned mouth with lowered brow',
-                'intensity': round((action_units['AU15']['intensity'] + action_units['AU04']['intensity']) / 2, 2)
-            })
-        
-        return combinations
 
 
-def get_facs_analyzer(use_simple=False):
+def get_facs_analyzer(use_simple=False, warmup=True):
     """
     Factory function to get FACS analyzer
     
     Args:
         use_simple: If True, use SimpleFACSDetector (OpenCV-based)
                    If False, try py-feat first, fall back to simple if unavailable
+        warmup: If True, start loading the analyzer's models on a background
+                thread so the first analysis doesn't pay for it; pass False
+                for short-lived scripts
     
     Returns:
         FACSAnalyzer: Pure FACS analyzer that returns muscle data, not emotions
     """
     if use_simple:
-        return SimpleFACSDetector()
-    
-    try:
-        # Try to use full FACS detector with py-feat
-        return FACSDetector()
-    except ImportError:
-        logging.warning("py-feat not available, falling back to SimpleFACS")
-        return SimpleFACSDetector()
+        analyzer = SimpleFACSDetector()
+    else:
+        try:
+            # Try to use full FACS detector with py-feat
+            analyzer = FACSDetector()
+        except ImportError:
+            logging.warning("py-feat not available, falling back to SimpleFACS")
+            analyzer = SimpleFACSDetector()
+    
+    if warmup:
+        # Models are process-wide singletons, so this also warms later instances
+        threading.Thread(target=analyzer._warm_up, name=f'{analyzer.analyzer_name}-warmup', daemon=True).start()
+    return analyzer
 
 # Backward compatibility
-def get_facs_detector(use_simple=False):
+def get_facs_detector(use_simple=False, warmup=True):
     """Deprecated: Use get_facs_analyzer instead"""
-    return get_facs_analyzer(use_simple)
\ No newline at end of file
+    return get_facs_analyzer(use_simple, warmup)
@@ -0,0 +1,52 @@
+"""
+Gunicorn configuration for the emotion detection app
+
+Usage: gunicorn -c gunicorn.conf.py wsgi:app
+"""
+
+import multiprocessing
+import os
+import sys
+import threading
+
+bind = os.environ.get('GUNICORN_BIND', '127.0.0.1:5000')
+
+# Independent uploads run in parallel across workers; threads overlap the
+# native FER/DeepFace/OpenCV calls, which release the GIL
+workers = int(os.environ.get('GUNICORN_WORKERS', multiprocessing.cpu_count() * 2 + 1))
+worker_class = 'gthread'
+threads = int(os.environ.get('GUNICORN_THREADS', 4))
+
+# Split the cores between all workers' backends; runs before the app (and
+# NumPy) is imported, which is when the BLAS/OpenMP pools read their size
+from thread_limits import limit_native_threads
+limit_native_threads(workers)
+
+# Import the app code once in the master so workers fork from an interpreter
+# that has already imported Flask, NumPy and OpenCV. The models are not
+# shared: FER/TensorFlow and py-feat are loaded lazily after fork, by
+# post_worker_init below, so every worker holds its own copy
+preload_app = True
+
+# Recycle workers periodically to bound TensorFlow/Keras memory growth
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 500))
+max_requests_jitter = 50
+
+# Model inference on large images can take a while on CPU
+timeout = 120
+
+
+def post_worker_init(worker):
+    """Load the detectors in each worker before its first request needs them"""
+    # In the background: loading can outlast the worker timeout, and the
+    # worker should start serving (and heartbeating) meanwhile
+    from image_processor import eager_init_backends
+    threading.Thread(target=eager_init_backends, name='backend-preload', daemon=True).start()
+
+
+def worker_exit(server, worker):
+    """Tear down TensorFlow state when a worker is recycled or shut down"""
+    # Only if a backend actually loaded TensorFlow - don't import it just to clear it
+    tf = sys.modules.get('tensorflow')
+    if tf is not None:
+        tf.keras.backend.clear_session()
@@ -1,36 +1,208 @@
+import asyncio
+import copy
 import cv2
+import hashlib
+import itertools
 import logging
-from emotion_backends import get_detector, get_available_backends
-from scipy.stats import pearsonr
+import math
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from emotion_backends import EMOTION_KEYS, EMOTION_KEY_SET, get_detector, get_available_backends, read_image
+from scipy.special import betainc
 import numpy as np
 
+# Backends run concurrently: the detectors spend most of their time in native
+# OpenCV/TensorFlow/PyTorch code that releases the GIL, so a request costs
+# roughly the slowest backend rather than the sum of all of them
+# (sized for several request threads each fanning out to every backend)
+BACKEND_POOL_SIZE = int(os.environ.get('BACKEND_POOL_SIZE', 8))
+_backend_pool = ThreadPoolExecutor(max_workers=BACKEND_POOL_SIZE, thread_name_prefix='backend')
+
+# Per-backend results keyed by (image digest, backend name), so re-uploads of
+# the same image - or the same image with extra backends - skip inference.
+# Entries are deep copies both ways, since callers are free to modify the
+# results they get back, nested dicts included
+RESULT_CACHE_SIZE = 512
+_result_cache = OrderedDict()
+_result_cache_lock = threading.Lock()
+
+def image_digest(img):
+    """Return a content hash of a decoded image"""
+    img = np.ascontiguousarray(img)
+    digest = hashlib.blake2b(img, digest_size=16)
+    # Include the shape so identical bytes with different layouts don't collide
+    digest.update(repr(img.shape).encode())
+    return digest.hexdigest()
+
+def _cached_result(key):
+    """Return a deep copy of a cached backend result, or None on a miss"""
+    with _result_cache_lock:
+        result = _result_cache.get(key)
+        if result is None:
+            return None
+        _result_cache.move_to_end(key)
+    return copy.deepcopy(result)
+
+def _cache_result(key, result):
+    """Store a successful backend result, evicting the least recently used"""
+    if 'error' in result:
+        return
+    with _result_cache_lock:
+        _result_cache[key] = copy.deepcopy(result)
+        _result_cache.move_to_end(key)
+        while len(_result_cache) > RESULT_CACHE_SIZE:
+            _result_cache.popitem(last=False)
+
+
+def eager_init_backends(backends=None):
+    """
+    Build every backend's detector ahead of the first request
+    
+    get_detector already keeps one detector per backend per process; this
+    only moves the model loading from the first upload to startup.
+    
+    Args:
+        backends (list): Backend names to load (default: all available)
+        
+    Returns:
+        list: Names of the backends that loaded
+    """
+    if backends is None:
+        backends = get_available_backends()
+    
+    loaded = []
+    for backend_name in backends:
+        try:
+            get_detector(backend_name)
+            loaded.append(backend_name)
+        except Exception as e:
+            # Leave it to the request path to report the failure
+            logging.error(f"Could not preload backend {backend_name}: {str(e)}")
+    return loaded
+
+
+# The legacy endpoints only ever use FER; keep its detector at hand instead
+# of going through the registry on every call
+_FER = None
+
+def _fer():
+    """Return the FER detector used by the legacy single-backend functions"""
+    global _FER
+    if _FER is None:
+        _FER = get_detector('fer')
+    return _FER
+
+# Fields of a backend result that the legacy format keeps
+_LEGACY_KEYS = ('emotions', 'dominant_emotion')
+
+def _legacy_result(result):
+    """Convert a FER backend result to the legacy format"""
+    if 'error' in result:
+        return {'error': result['error']}
+    return {k: result[k] for k in _LEGACY_KEYS}
 
 def analyze_image(image_path):
     """Legacy single-backend function for backward compatibility"""
     try:
-        # Use the new backend system with FER
-        fer_detector = get_detector('fer')
-        result = fer_detector.detect(image_path)
-        
-        # Convert to legacy format
-        if 'error' not in result:
-            return {
-                'emotions': result['emotions'],
-                'dominant_emotion': result['dominant_emotion']
-            }
-        else:
-            return {'error': result['error']}
+        # Decode here so the array path (and its result cache) is shared
+        img = read_image(image_path)
+        if img is not None:
+            return analyze_array(img)
+        # Unreadable file: FER reports the failure in its own format
+        return _legacy_result(_fer().detect(image_path))
+    except Exception as e:
+        logging.error(f"Error analyzing image: {str(e)}", exc_info=True)
+        return {'error': f'Error analyzing image: {str(e)}'}
+
+def analyze_array(img):
+    """Legacy single-backend analysis of an already decoded image"""
+    try:
+        key = (image_digest(img), 'fer')
+        result = _cached_result(key)
+        if result is None:
+            result = _fer().detect_array(img)
+            _cache_result(key, result)
+        return _legacy_result(result)
     except Exception as e:
         logging.error(f"Error analyzing image: {str(e)}", exc_info=True)
         return {'error': f'Error analyzing image: {str(e)}'}
 
-def analyze_image_multi(image_path, backends=None):
+def analyze_image_multi(image_path, backends=None, compute_comparison=True):
     """
     Analyze image with multiple emotion detection backends
     
     Args:
         image_path (str): Path to the image file
         backends (list): List of backend names to use (default: all available)
+        compute_comparison (bool): Add the cross-backend 'comparison' block; callers
+            that only show each backend on its own can skip it
+        
+    Returns:
+        dict: Results from all backends plus comparison metrics
+    """
+    if backends is None:
+        backends = get_available_backends()
+    
+    # Decode once and share the array, instead of every backend reading and
+    # decoding the same file (this also puts the result cache in play)
+    img = read_image(image_path)
+    if img is not None:
+        return analyze_array_multi(img, backends, compute_comparison)
+    
+    # Unreadable file: let each backend report the failure in its own format
+    def run_backend(backend_name):
+        detector_instance = get_detector(backend_name)
+        
+        # Check if this is a FACS analyzer (pure muscle data) or emotion detector
+        if detector_instance.capability == 'facs':
+            # FACS analyzer - returns pure muscle data
+            return detector_instance.analyze(image_path)
+        else:
+            # Emotion detector - returns emotion predictions
+            return detector_instance.detect(image_path)
+    
+    results = _run_backends(backends, run_backend, _backend_error)
+    return _summarize_results(results, backends, compute_comparison)
+
+def analyze_array_multi(img, backends=None, compute_comparison=True):
+    """
+    Analyze an already decoded image with multiple emotion detection backends
+    
+    Args:
+        img (np.ndarray): BGR image as returned by cv2.imdecode
+        backends (list): List of backend names to use (default: all available)
+        compute_comparison (bool): Add the cross-backend 'comparison' block; callers
+            that only show each backend on its own can skip it
+        
+    Returns:
+        dict: Results from all backends plus comparison metrics
+    """
+    if backends is None:
+        backends = get_available_backends()
+    
+    digest = image_digest(img)
+    
+    def run_backend(backend_name):
+        return _run_array_backend(backend_name, img, digest)
+    
+    results = _run_backends(backends, run_backend, _backend_error)
+    return _summarize_results(results, backends, compute_comparison)
+
+async def analyze_image_multi_async(image_path, backends=None, compute_comparison=True):
+    """
+    Coroutine version of analyze_image_multi for async servers
+    
+    Decoding and every backend run in worker threads via asyncio.to_thread,
+    so the event loop keeps accepting and decoding other requests while
+    the models work.
+    
+    Args:
+        image_path (str): Path to the image file
+        backends (list): List of backend names to use (default: all available)
+        compute_comparison (bool): Add the cross-backend 'comparison' block; callers
+            that only show each backend on its own can skip it
         
     Returns:
         dict: Results from all backends plus comparison metrics
@@ -38,41 +210,150 @@ def analyze_image_multi(image_path, backends=None):
     if backends is None:
         backends = get_available_backends()
     
+    img = await asyncio.to_thread(read_image, image_path)
+    if img is None:
+        # Unreadable file: the sync path lets each backend report it
+        return await asyncio.to_thread(analyze_image_multi, image_path, backends, compute_comparison)
+    digest = await asyncio.to_thread(image_digest, img)
+    
+    outcomes = await asyncio.gather(
+        *(asyncio.to_thread(_run_array_backend, backend_name, img, digest) for backend_name in backends),
+        return_exceptions=True
+    )
     results = {}
-    successful_results = {}
+    for backend_name, outcome in zip(backends, outcomes):
+        if isinstance(outcome, Exception):
+            logging.error(f"Error with backend {backend_name}: {str(outcome)}")
+            outcome = _backend_error(backend_name, outcome)
+        results[backend_name] = outcome
+    return _summarize_results(results, backends, compute_comparison)
+
+def _run_array_backend(backend_name, img, digest):
+    """Run one backend on a decoded image, through the result cache"""
+    key = (digest, backend_name)
+    result = _cached_result(key)
+    if result is None:
+        detector_instance = get_detector(backend_name)
+        
+        if detector_instance.capability == 'facs':
+            result = detector_instance.analyze_array(img)
+        else:
+            result = detector_instance.detect_array(img)
+        _cache_result(key, result)
+    return result
+
+def analyze_images_multi(image_paths, backends=None, compute_comparison=True):
+    """
+    Analyze a batch of images with multiple emotion detection backends
     
-    # Run analysis with each backend
-    for backend_name in backends:
+    The images are decoded once, concurrently, at the same size single
+    uploads are analyzed at, and shared by all backends. Each backend gets
+    the whole list through its detect_array_batch/analyze_array_batch hook,
+    which currently analyzes the images one by one for every backend.
+    
+    Args:
+        image_paths (list): Paths to the image files
+        backends (list): List of backend names to use (default: all available)
+        compute_comparison (bool): Add the cross-backend 'comparison' block; callers
+            that only show each backend on its own can skip it
+        
+    Returns:
+        list: One analyze_image_multi-style result dict per image, in input order
+    """
+    if backends is None:
+        backends = get_available_backends()
+    
+    # imread releases the GIL, so the decodes overlap each other
+    images = list(_backend_pool.map(read_image, image_paths))
+    
+    def run_backend(backend_name):
+        return _detect_images(backend_name, get_detector(backend_name), images, image_paths)
+    
+    def batch_error(backend_name, error):
+        return [_backend_error(backend_name, error) for _ in image_paths]
+    
+    backend_results = _run_backends(backends, run_backend, batch_error)
+    
+    return [
+        _summarize_results({name: batch[i] for name, batch in backend_results.items()}, backends,
+                           compute_comparison)
+        for i in range(len(image_paths))
+    ]
+
+def _detect_images(backend_name, detector_instance, images, image_paths):
+    """
+    Run a detector or FACS analyzer over decoded images via its batch hook
+    
+    Returns:
+        list: One result dict per image, in input order. Images that failed to
+        decode get the detector's own error for their file.
+    """
+    if detector_instance.capability == 'facs':
+        batch_method, path_method = 'analyze_array_batch', 'analyze'
+    else:
+        batch_method, path_method = 'detect_array_batch', 'detect'
+    
+    readable = [i for i, img in enumerate(images) if img is not None]
+    batch = getattr(detector_instance, batch_method)([images[i] for i in readable])
+    
+    results = [None] * len(images)
+    for i, result in zip(readable, batch):
+        results[i] = result
+    for i, result in enumerate(results):
+        if result is None:
+            results[i] = getattr(detector_instance, path_method)(image_paths[i])
+    return results
+
+def _run_backends(backends, run_backend, on_error):
+    """
+    Run run_backend(name) for every backend concurrently on the shared pool
+    
+    Returns:
+        dict: Backend name -> result, in the requested backend order. A backend
+        that raises gets on_error(name, exception) instead.
+    """
+    if len(backends) == 1:
+        # Nothing to overlap; skip the hand-off to the pool
+        backend_name = backends[0]
         try:
-            detector_instance = get_detector(backend_name)
-            
-            # Check if this is a FACS analyzer (pure muscle data) or emotion detector
-            if hasattr(detector_instance, 'analyze'):
-                # FACS analyzer - returns pure muscle data
-                result = detector_instance.analyze(image_path)
-            else:
-                # Emotion detector - returns emotion predictions
-                result = detector_instance.detect(image_path)
-            
-            results[backend_name] = result
-            
-            # Backend analysis completed
-            
-            # Store successful results for comparison (only emotion backends)
-            if ('error' not in result and result.get('face_detected', False) and 
-                result.get('analysis_type') != 'pure_facs'):
-                successful_results[backend_name] = result
-                
+            return {backend_name: run_backend(backend_name)}
         except Exception as e:
             logging.error(f"Error with backend {backend_name}: {str(e)}")
-            results[backend_name] = {
-                'error': f'Backend {backend_name} failed: {str(e)}',
-                'backend': backend_name,
-                'face_detected': False
-            }
+            return {backend_name: on_error(backend_name, e)}
+    
+    futures = {_backend_pool.submit(run_backend, backend_name): backend_name
+               for backend_name in backends}
+    
+    results = {}
+    for future in as_completed(futures):
+        backend_name = futures[future]
+        try:
+            results[backend_name] = future.result()
+        except Exception as e:
+            logging.error(f"Error with backend {backend_name}: {str(e)}")
+            results[backend_name] = on_error(backend_name, e)
+    
+    return {backend_name: results[backend_name] for backend_name in backends}
+
+def _backend_error(backend_name, error):
+    """Build the error entry reported for a backend that raised"""
+    return {
+        'error': f'Backend {backend_name} failed: {str(error)}',
+        'backend': backend_name,
+        'face_detected': False
+    }
+
+def _summarize_results(results, backends, compute_comparison=True):
+    """Add comparison metrics (unless disabled) and meta information to per-backend results"""
+    # Store successful results for comparison (only emotion backends)
+    successful_results = {
+        backend_name: result for backend_name, result in results.items()
+        if ('error' not in result and result.get('face_detected', False) and 
+            result.get('analysis_type') != 'pure_facs')
+    }
     
     # Add comparison metrics if we have multiple successful results
-    if len(successful_results) >= 2:
+    if compute_comparison and len(successful_results) >= 2:
         results['comparison'] = compare_results(successful_results)
     
     # Add meta information
@@ -108,36 +389,52 @@ def compare_results(results):
     }
     
     # Compare each pair of backends
-    for i, backend1 in enumerate(backend_names):
-        for backend2 in backend_names[i+1:]:
-            pair_key = f"{backend1}_vs_{backend2}"
-            
-            result1 = results[backend1]
-            result2 = results[backend2]
-            
-            # Dominant emotion agreement
-            dominant1 = result1.get('dominant_emotion')
-            dominant2 = result2.get('dominant_emotion')
-            agreement = bool(dominant1 == dominant2 if dominant1 and dominant2 else False)
-            
-            comparison['agreements'][pair_key] = {
-                'dominant_agreement': agreement,
-                'backend1_dominant': dominant1,
-                'backend2_dominant': dominant2
-            }
+    items = list(results.items())
+    for i, j in itertools.combinations(range(len(items)), 2):
+        backend1, result1 = items[i]
+        backend2, result2 = items[j]
+        pair_key = f"{backend1}_vs_{backend2}"
+        
+        # Dominant emotion agreement
+        dominant1 = result1.get('dominant_emotion')
+        dominant2 = result2.get('dominant_emotion')
+        agreement = bool(dominant1 == dominant2 if dominant1 and dominant2 else False)
+        
+        comparison['agreements'][pair_key] = {
+            'dominant_agreement': agreement,
+            'backend1_dominant': dominant1,
+            'backend2_dominant': dominant2
+        }
+    
+    # Correlations only exist between backends that reported emotions; pair
+    # those up directly instead of testing every pair
+    valid = [(name, result) for name, result in results.items() if result.get('emotions')]
+    if len(valid) >= 2:
+        emotion_dicts = [result['emotions'] for _, result in valid]
+        
+        # All pairwise emotion correlations at once when the backends report
+        # the same emotions (the usual case); otherwise each pair uses its
+        # common set
+        correlations = _correlation_matrix(emotion_dicts)
+        
+        # Every pairwise confidence difference in one array operation; only
+        # the final rounding happens per pair
+        confidences = np.array([result.get('confidence_score', 0) for _, result in valid], dtype=np.float64)
+        confidence_diffs = np.abs(confidences[:, None] - confidences).tolist()
+        
+        for i, j in itertools.combinations(range(len(valid)), 2):
+            pair_key = f"{valid[i][0]}_vs_{valid[j][0]}"
             
             # Emotion correlation
-            emotions1 = result1.get('emotions', {})
-            emotions2 = result2.get('emotions', {})
+            if correlations is not None:
+                r, n = correlations
+                correlation = _correlation_result(float(r[i, j]), n)
+            else:
+                correlation = calculate_emotion_correlation(emotion_dicts[i], emotion_dicts[j])
+            comparison['correlations'][pair_key] = correlation
             
-            if emotions1 and emotions2:
-                correlation = calculate_emotion_correlation(emotions1, emotions2)
-                comparison['correlations'][pair_key] = correlation
-                
-                # Confidence difference for dominant emotions
-                conf1 = result1.get('confidence_score', 0)
-                conf2 = result2.get('confidence_score', 0)
-                comparison['confidence_differences'][pair_key] = round(float(abs(conf1 - conf2)), 2)
+            # Confidence difference for dominant emotions
+            comparison['confidence_differences'][pair_key] = round(confidence_diffs[i][j], 2)
     
     # Calculate consensus if all backends agree
     all_dominants = [r.get('dominant_emotion') for r in results.values() if 'dominant_emotion' in r]
@@ -148,51 +445,128 @@ def compare_results(results):
             'confidence': 'high'
         }
     elif all_dominants:
-        # Find most common dominant emotion
-        from collections import Counter
-        emotion_counts = Counter(all_dominants)
-        most_common = emotion_counts.most_common(1)[0]
+        # Find most common dominant emotion (ties go to the first reported,
+        # as Counter.most_common did)
+        emotion_counts = {}
+        for emotion in all_dominants:
+            emotion_counts[emotion] = emotion_counts.get(emotion, 0) + 1
+        top_emotion = max(emotion_counts, key=emotion_counts.get)
+        top_count = emotion_counts[top_emotion]
         comparison['consensus'] = {
-            'emotion': most_common[0],
+            'emotion': top_emotion,
             'unanimous': False,
-            'confidence': 'medium' if most_common[1] > len(all_dominants) / 2 else 'low',
-            'agreement_ratio': round(most_common[1] / len(all_dominants), 2)
+            'confidence': 'medium' if top_count > len(all_dominants) / 2 else 'low',
+            'agreement_ratio': round(top_count / len(all_dominants), 2)
         }
     
     return comparison
 
-def calculate_emotion_correlation(emotions1, emotions2):
+def calculate_emotion_correlation(emotions1, emotions2, significance=True):
     """
     Calculate correlation between two emotion dictionaries
     
     Args:
         emotions1 (dict): First set of emotion scores
         emotions2 (dict): Second set of emotion scores
+        significance (bool): Include the two-sided p-value and significance flag
         
     Returns:
         dict: Correlation metrics
     """
-    # Get common emotions
-    common_emotions = set(emotions1.keys()) & set(emotions2.keys())
+    # Get common emotions (no set building for the usual full label set)
+    if emotions1.keys() == EMOTION_KEY_SET and emotions2.keys() == EMOTION_KEY_SET:
+        common_emotions = EMOTION_KEYS
+    else:
+        common_emotions = sorted(emotions1.keys() & emotions2.keys())
+    n = len(common_emotions)
     
-    if len(common_emotions) < 2:
-        return {'correlation': None, 'common_emotions': len(common_emotions)}
+    if n < 2:
+        return {'correlation': None, 'common_emotions': n}
     
     # Extract scores for common emotions
-    scores1 = [emotions1[emotion] for emotion in common_emotions]
-    scores2 = [emotions2[emotion] for emotion in common_emotions]
+    scores1 = [float(emotions1[emotion]) for emotion in common_emotions]
+    scores2 = [float(emotions2[emotion]) for emotion in common_emotions]
     
     try:
-        correlation, p_value = pearsonr(scores1, scores2)
-        return {
-            'correlation': round(float(correlation), 2),
-            'p_value': round(float(p_value), 4),
-            'common_emotions': len(common_emotions),
-            'significant': bool(p_value < 0.05 if not np.isnan(p_value) else False)
-        }
+        return _correlation_result(_pearson_pair(scores1, scores2), n, significance)
     except Exception as e:
         return {
             'correlation': None,
             'error': str(e),
-            'common_emotions': len(common_emotions)
-        }
\ No newline at end of file
+            'common_emotions': n
+        }
+
+def _correlation_matrix(emotion_sets):
+    """
+    Pearson correlations between every pair of backends' emotion scores
+    
+    Args:
+        emotion_sets (list): Non-empty emotion dicts, one per backend
+        
+    Returns:
+        tuple: (B x B correlation matrix in input order, number of emotions),
+        or None if the backends don't all report the same set of emotions
+    """
+    if all(emotions.keys() == EMOTION_KEY_SET for emotions in emotion_sets):
+        keys = EMOTION_KEYS
+    else:
+        keys = sorted(emotion_sets[0])
+        if len(keys) < 2 or any(emotions.keys() != emotion_sets[0].keys() for emotions in emotion_sets):
+            return None
+    scores = np.array([[emotions[k] for k in keys] for emotions in emotion_sets], dtype=np.float64)
+    return _pearson_matrix(scores), len(keys)
+
+def _pearson_matrix(scores):
+    """
+    Pearson's r between every pair of rows of a (B, K) score matrix
+    
+    Rows are centred and scaled to unit length once, so the whole matrix is a
+    single matmul. Constant rows correlate as NaN, as in scipy.stats.pearsonr.
+    """
+    centred = scores - scores.mean(axis=1, keepdims=True)
+    norms = np.sqrt(np.einsum('ij,ij->i', centred, centred))
+    # Test constancy exactly: the centred row may carry rounding residue
+    norms[(scores == scores[:, :1]).all(axis=1)] = np.nan
+    unit = centred / norms[:, None]
+    return np.clip(unit @ unit.T, -1.0, 1.0)
+
+def _pearson_pair(scores1, scores2):
+    """
+    Pearson's r between two short score lists
+    
+    For a handful of emotions a scalar loop beats building arrays for
+    _pearson_matrix several times over. Same conventions: constant inputs
+    give NaN and r is clipped to [-1, 1].
+    """
+    n = len(scores1)
+    mean1 = sum(scores1) / n
+    mean2 = sum(scores2) / n
+    cov = var1 = var2 = 0.0
+    for x, y in zip(scores1, scores2):
+        x -= mean1
+        y -= mean2
+        cov += x * y
+        var1 += x * x
+        var2 += y * y
+    if scores1.count(scores1[0]) == n or scores2.count(scores2[0]) == n:
+        return math.nan
+    return max(-1.0, min(1.0, cov / math.sqrt(var1 * var2)))
+
+def _correlation_result(r, n, significance=True):
+    """Build the correlation entry for Pearson's r over n emotions"""
+    if not significance:
+        return {'correlation': round(r, 2), 'common_emotions': n}
+    
+    if math.isnan(r):
+        p_value = math.nan
+    elif n == 2:
+        p_value = 1.0
+    else:
+        # Under H0, r follows a symmetric beta distribution on [-1, 1]
+        p_value = float(betainc(n / 2 - 1, 0.5, 1.0 - r * r))
+    return {
+        'correlation': round(r, 2),
+        'p_value': round(p_value, 4),
+        'common_emotions': n,
+        'significant': bool(p_value < 0.05 if not np.isnan(p_value) else False)
+    }
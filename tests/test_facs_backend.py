@@ -0,0 +1,66 @@
+import unittest
+
+import cv2
+import numpy as np
+
+from facs_backend import SimpleFACSDetector, _roi_stats
+
+
+def _previous_region_aus(face_roi):
+    """AU12, AU01 and AU26 as the np.sum/np.var implementation computed them"""
+    h, w = face_roi.shape
+    mouth_region = face_roi[int(h*0.6):, :]
+    brow_region = face_roi[:int(h*0.3), :]
+    lower_face = face_roi[int(h*0.7):, :]
+    mouth_activity = np.sum(cv2.Canny(mouth_region, 50, 150)) / (mouth_region.shape[0] * mouth_region.shape[1])
+    brow_activity = np.sum(cv2.Canny(brow_region, 30, 100)) / (brow_region.shape[0] * brow_region.shape[1])
+    return {
+        'AU12': round(min(1.0, mouth_activity / 50), 3),
+        'AU01': round(min(1.0, brow_activity / 40), 3),
+        'AU26': round(min(1.0, np.var(lower_face) / 2000), 3)
+    }
+
+
+class RoiStatsTest(unittest.TestCase):
+    
+    def test_edge_sums_round_like_numpy(self):
+        # 1 edge pixel in 8 puts AU12 exactly on a rounding tie (0.6375)
+        edges = np.zeros((8, 8), np.uint8)
+        edges[0, :] = 255
+        mouth_sum, brow_sum, _, _ = _roi_stats(edges, edges, edges, edges.astype(np.int16))
+        self.assertIsInstance(mouth_sum, np.float64)
+        self.assertEqual(round(min(1.0, mouth_sum / edges.size / 50), 3),
+                         round(min(1.0, np.sum(edges) / edges.size / 50), 3))
+    
+    def test_matches_numpy_reductions(self):
+        rng = np.random.default_rng(0)
+        for _ in range(200):
+            roi = rng.integers(0, 256, tuple(rng.integers(8, 120, 2)), dtype=np.uint8)
+            edges = cv2.Canny(roi, 50, 150)
+            texture = cv2.Laplacian(roi, cv2.CV_16S)
+            mouth_sum, brow_sum, variance, texture_variance = _roi_stats(edges, edges, roi, texture)
+            self.assertEqual(mouth_sum, np.sum(edges))
+            self.assertEqual(brow_sum, np.sum(edges))
+            self.assertAlmostEqual(variance, np.var(roi), delta=1e-9 * np.var(roi))
+            self.assertAlmostEqual(texture_variance, cv2.Laplacian(roi, cv2.CV_64F).var(),
+                                   delta=1e-9 * texture_variance)
+
+
+class ApproximateActionUnitsTest(unittest.TestCase):
+    
+    def test_matches_previous_implementation(self):
+        detector = SimpleFACSDetector()
+        rng = np.random.default_rng(0)
+        for _ in range(3000):
+            h, w = rng.integers(8, 120, 2)
+            # Blocky binary ROIs give edge densities that land on rounding ties
+            blocks = rng.integers(0, 2, (h // 4 + 1, w // 4 + 1), dtype=np.uint8) * 200
+            roi = np.kron(blocks, np.ones((4, 4), np.uint8))[:h, :w].copy()
+            action_units = detector._approximate_action_units(roi, [])
+            for au, expected in _previous_region_aus(roi).items():
+                if expected > 0.05:
+                    self.assertEqual(action_units[au], expected, (h, w, au))
+
+
+if __name__ == '__main__':
+    unittest.main()
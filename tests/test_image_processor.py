@@ -0,0 +1,51 @@
+import unittest
+
+import image_processor
+from image_processor import _cache_result, _cached_result
+
+
+class ResultCacheTest(unittest.TestCase):
+    
+    def setUp(self):
+        image_processor._result_cache.clear()
+    
+    def tearDown(self):
+        image_processor._result_cache.clear()
+    
+    def _result(self):
+        return {
+            'emotions': {'happy': 0.75, 'sad': 0.25},
+            'action_units': {'AU12': {'intensity': 0.5, 'description': 'Lip Corner Puller'}},
+            'box': [1, 2, 3, 4]
+        }
+    
+    def test_mutating_returned_result_leaves_cache_intact(self):
+        key = ('digest', 'fer')
+        _cache_result(key, self._result())
+        
+        returned = _cached_result(key)
+        returned['emotions']['happy'] = 0.0
+        returned['action_units']['AU12']['intensity'] = 1.0
+        returned['box'].append(5)
+        returned['extra'] = True
+        
+        self.assertEqual(_cached_result(key), self._result())
+    
+    def test_mutating_stored_result_leaves_cache_intact(self):
+        key = ('digest', 'fer')
+        result = self._result()
+        _cache_result(key, result)
+        
+        result['emotions']['sad'] = 1.0
+        result['action_units']['AU12']['intensity'] = 0.0
+        
+        self.assertEqual(_cached_result(key), self._result())
+    
+    def test_error_results_are_not_cached(self):
+        key = ('digest', 'fer')
+        _cache_result(key, {'error': 'No face detected'})
+        self.assertIsNone(_cached_result(key))
+
+
+if __name__ == '__main__':
+    unittest.main()
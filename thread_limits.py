@@ -0,0 +1,47 @@
+"""
+Native thread caps for the inference libraries
+
+Every gunicorn worker runs up to three backends side by side (FER, DeepFace
+and one FACS analyzer), and each native runtime (OpenMP/MKL/OpenBLAS under
+NumPy and PyTorch, TensorFlow, OpenCV) would otherwise start a thread per
+core for every one of them, in every worker. The cores are split between
+them instead.
+
+BLAS and OpenMP read these variables once, when they load, so
+limit_native_threads() must run before NumPy, OpenCV or any model library
+is imported - this module imports nothing but os for that reason.
+"""
+
+import os
+
+# Backends a single request can run concurrently
+BACKENDS_PER_REQUEST = 3
+
+_THREAD_VARS = ('OMP_NUM_THREADS', 'OPENBLAS_NUM_THREADS', 'MKL_NUM_THREADS', 'TF_NUM_INTRAOP_THREADS')
+
+
+def limit_native_threads(workers=None):
+    """
+    Cap native thread pools for this process (existing settings win)
+    
+    Args:
+        workers (int): Server worker processes sharing the host
+            (default: GUNICORN_WORKERS, else WEB_CONCURRENCY for ASGI
+            servers, else 1)
+    
+    Returns:
+        int: Threads allowed per backend, also exported as BACKEND_THREADS
+    """
+    if workers is None:
+        # hypercorn/uvicorn don't tell their workers how many there are;
+        # WEB_CONCURRENCY is the conventional variable (uvicorn reads it too)
+        workers = int(os.environ.get('GUNICORN_WORKERS') or os.environ.get('WEB_CONCURRENCY') or 1)
+    threads = int(os.environ.get('BACKEND_THREADS', 0)) or max(
+        1, (os.cpu_count() or 1) // (max(1, workers) * BACKENDS_PER_REQUEST))
+    
+    # setdefault throughout: the first caller (gunicorn.conf.py, which knows
+    # the worker count) decides, later calls just read the result back
+    os.environ.setdefault('BACKEND_THREADS', str(threads))
+    for var in _THREAD_VARS:
+        os.environ.setdefault(var, str(threads))
+    return threads